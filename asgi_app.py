@@ -0,0 +1,536 @@
+# asgi_app.py
+# Optional asyncio serving mode: the webhook pipeline on one event loop, with aiomysql for the databases,
+# httpx for the Graph API and chart rendering on a small thread pool. Thousands of conversations can be
+# in flight in one process because waiting on MySQL or graph.facebook.com no longer holds a thread.
+#   pip install -r requirements-async.txt
+#   uvicorn asgi_app:app --host 0.0.0.0 --port 3000
+# The Flask app in main.py (gunicorn) is unchanged and remains the default way to run the bot.
+import asyncio
+import contextlib
+import itertools
+import sqlite3
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import httpx
+import pymysql
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+from config import (ACCESS_TOKEN, ASYNC_CHART_THREADS, ASYNC_GRAPH_POOL_SIZE, ASYNC_MAX_ACTIVE_CONVERSATIONS,
+                    ASYNC_MAX_PENDING_CONVERSATIONS, ATTENDANCE_CACHE_MAX_ENTRIES, ATTENDANCE_CACHE_TTL,
+                    CHART_CACHE_MAX_ENTRIES, CHART_MEDIA_TTL, CHART_PALETTE_COLORS, CHART_PNG_COMPRESSION,
+                    CHART_PNG_TTL, CHART_SIZE, CONVERSATION_CACHE_MAX_ENTRIES, CONVERSATION_CACHE_TTL,
+                    DB_ATTENDANCE_CONFIG, DB_ATTENDANCE_POOL_CONFIG, DB_HIERARCHY_CONFIG, DB_HIERARCHY_POOL_CONFIG,
+                    DEDUP_BACKEND, DEDUP_SQLITE_PATH, DEDUP_TTL, GRAPH_API_BASE_URL, GRAPH_BACKOFF_BASE,
+                    GRAPH_BACKOFF_MAX, GRAPH_MAX_RETRIES, GRAPH_TIMEOUT, PHONE_NUMBER_ID, TREND_HISTORY_DAYS,
+                    TREND_STORE_PATH, VERIFY_TOKEN, WARM_UP_ENABLED, WHATSAPP_SEND_BURST, WHATSAPP_SEND_RATE,
+                    WORKER_SHUTDOWN_TIMEOUT)
+from async_db import (AsyncDatabase, AsyncHierarchyIndex, fetch_daily_status_counts, fetch_todays_attendance_rows,
+                      fetch_todays_status_counts)
+from attendance import NO_BAS_TODAY, build_org_rollup, org_node, summarize_attendance
+from cache import TTLCache
+from chart_cache import ChartCache
+from chart_renderer import DonutChartRenderer, prime_chart_rendering, render_trend_figure
+from dedup import create_dedup_store
+from flows import ROLE_FLOWS, message_flow, pm_flow, user_fields
+from hierarchy import normalize_phone
+from metrics import (flow_seconds, messages_total, outbound_errors_total, registry, stage_seconds, stats_samples,
+                     webhook_messages_total)
+from report_messages import (CAPTION_LIMIT, CHART_FAILED, NO_CHART_DATA, NO_ROLE, NOT_REGISTERED, button_payload,
+                             image_payload, list_payload, no_flow_text, pack_messages, text_payload)
+from trends import build_trend, create_trend_store
+from webhook_messages import describe_message, iter_webhook_messages, message_intent, selected_option_id
+from whatsapp_client import AsyncGraphApiClient
+
+
+# --- CONVERSATION SCHEDULER ---
+# The asyncio counterpart of workers.KeyedWorkerPool: one task per webhook batch, batches from the
+# same sender run in arrival order, and at most max_active run at once.
+class ConversationScheduler:
+    def __init__(self, max_active, max_pending):
+        self.max_active = max_active
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_active)
+        self._tails = {}
+        self._tasks = set()
+        self._active = 0
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    def submit(self, key, fn, *args):
+        # Returns False (and schedules nothing) when max_pending batches are already waiting or running.
+        if len(self._tasks) >= self.max_pending:
+            self._stats["rejected"] += 1
+            return False
+        task = asyncio.get_running_loop().create_task(self._run(self._tails.get(key), fn, args))
+        self._tails[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(lambda done: self._finished(key, done))
+        self._stats["submitted"] += 1
+        return True
+
+    async def shutdown(self, timeout):
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+
+    def stats(self):
+        return dict(self._stats, active=self._active, pending=len(self._tasks), max_active=self.max_active,
+                    max_pending=self.max_pending)
+
+    async def _run(self, previous, fn, args):
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with self._semaphore:
+            self._active += 1
+            try:
+                await fn(*args)
+            finally:
+                self._active -= 1
+
+    def _finished(self, key, task):
+        self._tasks.discard(task)
+        if self._tails.get(key) is task:
+            del self._tails[key]
+        if task.cancelled() or task.exception() is not None:
+            self._stats["failed"] += 1
+            if not task.cancelled():
+                print(f"[ASYNC] Conversation task failed: {task.exception()}")
+        else:
+            self._stats["completed"] += 1
+
+
+# --- SHARED CLIENTS AND CACHES ---
+graph_client = AsyncGraphApiClient(ACCESS_TOKEN, PHONE_NUMBER_ID, GRAPH_API_BASE_URL, send_rate=WHATSAPP_SEND_RATE,
+                                   send_burst=WHATSAPP_SEND_BURST, max_retries=GRAPH_MAX_RETRIES,
+                                   backoff_base=GRAPH_BACKOFF_BASE, backoff_max=GRAPH_BACKOFF_MAX,
+                                   timeout=GRAPH_TIMEOUT, pool_size=ASYNC_GRAPH_POOL_SIZE)
+hierarchy_db = AsyncDatabase(DB_HIERARCHY_CONFIG, "hierarchy", DB_HIERARCHY_POOL_CONFIG['min_size'],
+                             DB_HIERARCHY_POOL_CONFIG['max_size'], DB_HIERARCHY_POOL_CONFIG['max_lifetime'])
+attendance_db = AsyncDatabase(DB_ATTENDANCE_CONFIG, "attendance", DB_ATTENDANCE_POOL_CONFIG['min_size'],
+                              DB_ATTENDANCE_POOL_CONFIG['max_size'], DB_ATTENDANCE_POOL_CONFIG['max_lifetime'])
+hierarchy_index = AsyncHierarchyIndex(hierarchy_db)
+attendance_cache = TTLCache(ATTENDANCE_CACHE_MAX_ENTRIES, ATTENDANCE_CACHE_TTL, name="attendance")
+conversation_cache = TTLCache(CONVERSATION_CACHE_MAX_ENTRIES, CONVERSATION_CACHE_TTL, name="conversation")
+chart_renderer = DonutChartRenderer(CHART_SIZE, CHART_PNG_COMPRESSION, CHART_PALETTE_COLORS)
+chart_cache = ChartCache(CHART_CACHE_MAX_ENTRIES, CHART_PNG_TTL, CHART_MEDIA_TTL)
+# Rendering is CPU-bound; it runs here so it never blocks the event loop.
+chart_executor = ThreadPoolExecutor(ASYNC_CHART_THREADS, thread_name_prefix="chart-render")
+dedup_store = create_dedup_store(DEDUP_BACKEND, DEDUP_TTL, DEDUP_SQLITE_PATH)
+trend_store = create_trend_store(TREND_STORE_PATH, TREND_HISTORY_DAYS)
+trend_sync_lock = asyncio.Lock()
+conversations = ConversationScheduler(ASYNC_MAX_ACTIVE_CONVERSATIONS, ASYNC_MAX_PENDING_CONVERSATIONS)
+_attendance_loads = {}
+
+
+# --- BACKGROUND CONVERSATION ---
+async def process_messages(sender_phone, messages):
+    # Handles one sender's messages from a webhook batch in order, with a single user lookup.
+    try:
+        with stage_seconds.time('user_lookup'):
+            user_details = await get_user_details(sender_phone)
+        if not user_details:
+            await send_text_message(sender_phone, NOT_REGISTERED)
+            return
+
+        user_role = user_details.get('role')
+        if not user_role:
+            await send_text_message(sender_phone, NO_ROLE)
+            return
+
+        role_flow = ROLE_FLOWS.get(user_role)
+        if not role_flow and await has_direct_reports(user_details['user_id']):
+            role_flow = pm_flow
+        if not role_flow:
+            await send_text_message(sender_phone, no_flow_text(user_role))
+            return
+
+        previous_intent = None
+        for message_data in messages:
+            intent = message_intent(message_data)
+            if intent == previous_intent:
+                print(f"[COALESCED] Skipping repeated {intent} from {sender_phone[-4:]}")
+                continue
+            previous_intent = intent
+            with flow_seconds.time(user_role):
+                try:
+                    await run_flow(sender_phone,
+                                   message_flow(role_flow, user_details, selected_option_id(message_data)))
+                    messages_total.inc(user_role, 'ok')
+                except Exception as e:
+                    messages_total.inc(user_role, 'error')
+                    print(f"Error handling message {message_data.get('id')}: {e}")
+                    traceback.print_exc()
+    except Exception as e:
+        print(f"Error in conversation task: {e}")
+        traceback.print_exc()
+
+
+# --- WEBHOOK HANDLER ---
+async def webhook(request):
+    if request.method == 'GET':
+        mode = request.query_params.get("hub.mode")
+        token = request.query_params.get("hub.verify_token")
+        challenge = request.query_params.get("hub.challenge")
+        if mode == "subscribe" and token == VERIFY_TOKEN:
+            return PlainTextResponse(challenge or "")
+        return PlainTextResponse("Verification failed", status_code=403)
+    try:
+        data = await request.json()
+        if not data or 'entry' not in data:
+            return PlainTextResponse("OK")
+        batches = {}
+        for message in iter_webhook_messages(data):
+            message_id = message.get('id')
+            sender_phone = message.get('from')
+            if not message_id or not sender_phone or sender_phone == PHONE_NUMBER_ID:
+                continue
+            print(f"[MESSAGE] From: {sender_phone[-4:]} | Type: {message.get('type', 'unknown')} | "
+                  f"Content: {describe_message(message)}")
+            # The dedup store is SQLite by default (5 s busy timeout), so it is kept off the event loop.
+            if not await asyncio.to_thread(dedup_store.add_if_new, message_id):
+                webhook_messages_total.inc('duplicate')
+                print(f"[DUPLICATE] Message already processed: {message_id}")
+                continue
+            batches.setdefault(sender_phone, []).append(message)
+
+        deferred = []
+        for sender_phone, messages in batches.items():
+            if conversations.submit(sender_phone, process_messages, sender_phone, messages):
+                webhook_messages_total.inc('accepted', amount=len(messages))
+            else:
+                deferred.extend(m['id'] for m in messages)
+        if deferred:
+            webhook_messages_total.inc('deferred', amount=len(deferred))
+            for message_id in deferred:
+                await asyncio.to_thread(dedup_store.forget, message_id)
+            print(f"[BUSY] Too many conversations in flight, deferring {len(deferred)} message(s)")
+            return PlainTextResponse("Busy", status_code=503)
+    except Exception as e:
+        print(f"[ERROR] Webhook handler: {e}")
+    return PlainTextResponse("OK")
+
+
+# --- CHART GENERATION ---
+async def create_attendance_pie_chart(data, title):
+    if not data or sum(data.values()) == 0:
+        return None
+    cache_key = ChartCache.key(data, title, chart_renderer.cache_token)
+    with stage_seconds.time('chart'):
+        return await asyncio.get_running_loop().run_in_executor(
+            chart_executor, chart_cache.render, cache_key,
+            lambda: chart_renderer.render(dict(sorted(data.items())), title))
+
+
+async def create_attendance_trend_chart(points, title):
+    if not any(rate is not None for _, rate in points):
+        return None
+    cache_key = ChartCache.key(dict(points), title, 'trend-line')
+    with stage_seconds.time('chart'):
+        return await asyncio.get_running_loop().run_in_executor(
+            chart_executor, chart_cache.render, cache_key, lambda: render_trend_figure(points, title))
+
+
+# --- FLOW DRIVER ---
+async def run_flow(phone, flow):
+    # Awaits each operation a flows.py generator yields and sends the result back in (see main.run_flow).
+    result = None
+    while True:
+        try:
+            name, *args = flow.send(result)
+        except StopIteration:
+            return
+        result = await (FLOW_QUERIES[name](*args) if name in FLOW_QUERIES else FLOW_REPLIES[name](phone, *args))
+
+
+async def send_chart_report(phone, chart_data, title, caption_text):
+    return await send_chart_and_text_report(phone, await create_attendance_pie_chart(chart_data, title), caption_text)
+
+
+async def send_trend_report(phone, points, title, caption_text):
+    return await send_chart_and_text_report(phone, await create_attendance_trend_chart(points, title), caption_text)
+
+
+# --- CONVERSATION STATE ---
+async def remember_selection(phone, option_id, value):
+    conversation_cache.set((phone, option_id), value)
+
+
+async def recall_selection(phone, option_id):
+    return conversation_cache.get((phone, option_id))
+
+
+# --- DATABASE HELPERS ---
+# Hierarchy lookups are answered from the in-memory snapshot, which a background task keeps fresh.
+async def get_user_details(phone_number):
+    snapshot = await hierarchy_index.ensure_loaded()
+    return user_fields(snapshot.by_phone.get(normalize_phone(phone_number))) if snapshot else None
+
+
+async def get_user_details_by_id(user_id):
+    snapshot = await hierarchy_index.ensure_loaded()
+    return user_fields(snapshot.by_id.get(user_id), ('user_id', 'name', 'role', 'phone')) if snapshot else None
+
+
+async def get_subordinates_by_role(manager_id, role):
+    snapshot = await hierarchy_index.ensure_loaded()
+    return [user_fields(u) for u in snapshot.by_manager_role.get((manager_id, role), [])] if snapshot else []
+
+
+async def get_supervisor_team_leads():
+    snapshot = await hierarchy_index.ensure_loaded()
+    return snapshot.supervisor_team_leads() if snapshot else []
+
+
+async def has_direct_reports(user_id):
+    snapshot = await hierarchy_index.ensure_loaded()
+    return bool(snapshot and snapshot.direct_reports(user_id))
+
+
+async def get_ba_attendance_by_supervisor(supervisor_names):
+    if not supervisor_names:
+        return "No supervisors found.", {}, {}
+    cache_key = ('summary', date.today().isoformat(), tuple(supervisor_names))
+    try:
+        with stage_seconds.time('attendance'):
+            return await _load_cached(cache_key, lambda: _load_attendance_by_supervisor(supervisor_names))
+    except pymysql.MySQLError as err:
+        print(f"Attendance DB Error: {err}")
+        return "Error fetching attendance data.", {}, {}
+
+
+async def _load_attendance_by_supervisor(supervisor_names):
+    todays_bas = await fetch_todays_attendance_rows(attendance_db, supervisor_names)
+    summary, stats, supervisor_stats = summarize_attendance(supervisor_names, todays_bas)
+    if not todays_bas:
+        summary = NO_BAS_TODAY
+    return summary, stats, supervisor_stats
+
+
+async def get_company_attendance_rollup():
+    snapshot = await hierarchy_index.ensure_loaded()
+    if snapshot is None:
+        return None
+    supervisors = snapshot.supervisor_team_leads()
+    if not supervisors:
+        return None
+    names = sorted({s['name'] for s in supervisors})
+    cache_key = ('counts', date.today().isoformat(), tuple(names))
+    try:
+        with stage_seconds.time('attendance'):
+            counts = await _load_cached(cache_key, lambda: fetch_todays_status_counts(attendance_db, names))
+        return build_org_rollup(snapshot, counts)
+    except pymysql.MySQLError as err:
+        print(f"Attendance DB Error: {err}")
+        return None
+
+
+async def get_org_node(user_id):
+    snapshot = await hierarchy_index.ensure_loaded()
+    if snapshot is None:
+        return None
+    rollup = await get_company_attendance_rollup()
+    if not rollup:
+        return None
+    return org_node(snapshot, rollup['totals'], user_id)
+
+
+async def get_attendance_trend(supervisor_names, groups=None):
+    # The rollup is local SQLite, so its reads and writes run on a worker thread, off the event loop.
+    today = date.today()
+    with stage_seconds.time('trends'):
+        await sync_trend_store(today)
+        return await asyncio.to_thread(build_trend, trend_store, supervisor_names, today, groups)
+
+
+async def sync_trend_store(today):
+    # As in main.sync_trend_store: on a MySQL or SQLite error the days already stored are served.
+    async with trend_sync_lock:
+        try:
+            missing = await asyncio.to_thread(trend_store.missing_range, today)
+            if missing is not None:
+                rows = await fetch_daily_status_counts(attendance_db, *missing)
+                await asyncio.to_thread(trend_store.store, *missing, rows)
+        except pymysql.MySQLError as err:
+            print(f"Trend sync DB Error: {err}")
+        except sqlite3.Error as err:
+            print(f"Trend store error: {err}")
+
+
+async def _load_cached(key, loader):
+    # attendance_cache with asyncio single-flight: concurrent misses for a key await one query.
+    value = attendance_cache.get(key)
+    if value is not None:
+        return value
+    task = _attendance_loads.get(key)
+    if task is None:
+        task = _attendance_loads[key] = asyncio.get_running_loop().create_task(_load_and_store(key, loader))
+    return await asyncio.shield(task)
+
+
+async def _load_and_store(key, loader):
+    try:
+        value = await loader()
+        attendance_cache.set(key, value)
+        return value
+    finally:
+        _attendance_loads.pop(key, None)
+
+
+# --- WHATSAPP MESSAGE SENDERS ---
+async def send_chart_and_text_report(phone, image_buffer, caption_text):
+    if image_buffer:
+        media_id = await upload_whatsapp_media(image_buffer)
+        if media_id:
+            chunks = pack_messages(caption_text, first_limit=CAPTION_LIMIT)
+            return (await send_whatsapp_image_message(phone, media_id, next(chunks, ""))
+                    and await _send_text_chunks(phone, chunks))
+        return await send_text_message(phone, itertools.chain([CHART_FAILED], _pieces(caption_text)))
+    return await send_text_message(phone, itertools.chain([NO_CHART_DATA], _pieces(caption_text)))
+
+
+def _pieces(text):
+    return [text] if isinstance(text, str) else text
+
+
+async def send_interactive_list_message(phone, header_text, body_text, button_text, sections):
+    return await send_whatsapp_message(list_payload(phone, header_text, body_text, button_text, sections))
+
+
+async def send_interactive_button_message(phone, body, buttons):
+    if not buttons: return
+    return await send_whatsapp_message(button_payload(phone, body, buttons))
+
+
+async def send_text_message(phone, message):
+    return await _send_text_chunks(phone, pack_messages(message))
+
+
+async def _send_text_chunks(phone, chunks):
+    # Awaited one at a time so the chunks arrive in order.
+    for chunk in chunks:
+        if not await send_whatsapp_message(text_payload(phone, chunk)):
+            return False
+    return True
+
+
+async def send_whatsapp_image_message(phone, media_id, caption=""):
+    return await send_whatsapp_message(image_payload(phone, media_id, caption))
+
+
+async def upload_whatsapp_media(image_buffer):
+    cache_key = getattr(image_buffer, 'cache_key', None)
+    media_id = chart_cache.cached_media_id(cache_key) if cache_key else None
+    if media_id:
+        return media_id
+    try:
+        with stage_seconds.time('media_upload'):
+            media_id = await graph_client.upload_media(image_buffer.getvalue(), 'attendance.png', 'image/png')
+        print(f"Media uploaded successfully. ID: {media_id}")
+    except httpx.HTTPError as e:
+        outbound_errors_total.inc('media')
+        print(f"Error uploading media: {e}")
+        if isinstance(e, httpx.HTTPStatusError): print(f"Response body: {e.response.text}")
+        return None
+    if cache_key:
+        chart_cache.store_media_id(cache_key, media_id)
+    return media_id
+
+
+async def send_whatsapp_message(payload):
+    try:
+        with stage_seconds.time('message_send'):
+            await graph_client.send_message(payload)
+        return True
+    except httpx.HTTPStatusError as e:
+        print(f"Error sending message: {e}")
+        print(f"Response body: {e.response.text}")
+    except httpx.HTTPError as e:
+        print(f"Error sending message: {e}")
+    outbound_errors_total.inc('messages')
+    return False
+
+
+FLOW_QUERIES = {
+    'user_by_id': get_user_details_by_id,
+    'subordinates': get_subordinates_by_role,
+    'supervisor_team_leads': get_supervisor_team_leads,
+    'company_rollup': get_company_attendance_rollup,
+    'org_node': get_org_node,
+    'attendance': get_ba_attendance_by_supervisor,
+    'trend': get_attendance_trend,
+}
+
+FLOW_REPLIES = {
+    'recall': recall_selection,
+    'remember': remember_selection,
+    'chart_report': send_chart_report,
+    'trend_report': send_trend_report,
+    'text': send_text_message,
+    'list': send_interactive_list_message,
+    'buttons': send_interactive_button_message,
+}
+
+
+# --- HEALTH AND METRICS ---
+async def health_check(request):
+    return JSONResponse({"status": "healthy", "timestamp": date.today().isoformat(),
+                         "conversations": conversations.stats(), "graph_api": graph_client.stats(),
+                         "db_pools": {"hierarchy": hierarchy_db.stats(), "attendance": attendance_db.stats()},
+                         "trend_store": await asyncio.to_thread(trend_store.stats)})
+
+
+async def metrics(request):
+    # Rendered on a worker thread: the trend store collector reads SQLite.
+    return Response(await asyncio.to_thread(registry.render), media_type='text/plain; version=0.0.4')
+
+
+def collect_component_stats():
+    yield from stats_samples("whatsapp_async_conversations", conversations.stats())
+    yield from stats_samples("whatsapp_db_pool", hierarchy_db.stats(), pool="hierarchy")
+    yield from stats_samples("whatsapp_db_pool", attendance_db.stats(), pool="attendance")
+    yield from stats_samples("whatsapp_cache", attendance_cache.stats(), cache="attendance")
+    yield from stats_samples("whatsapp_cache", conversation_cache.stats(), cache="conversation")
+    for name, cache_stats in chart_cache.stats().items():
+        yield from stats_samples("whatsapp_cache", cache_stats, cache=f"chart_{name}")
+    for endpoint, endpoint_stats in graph_client.stats().items():
+        yield from stats_samples("whatsapp_graph_api", endpoint_stats, endpoint=endpoint)
+    yield from stats_samples("whatsapp_trend_store", trend_store.stats())
+    hierarchy_age = hierarchy_index.age()
+    if hierarchy_age is not None:
+        yield "whatsapp_hierarchy_snapshot_age_seconds", {}, hierarchy_age
+
+
+registry.register_collector(collect_component_stats)
+
+
+# --- APP LIFECYCLE ---
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await hierarchy_db.start()
+    await attendance_db.start()
+    await hierarchy_index.ensure_loaded()
+    if WARM_UP_ENABLED:
+        try:
+            await asyncio.get_running_loop().run_in_executor(chart_executor, prime_chart_rendering, chart_renderer)
+        except Exception as e:
+            # Not worth failing startup over: the first chart request pays for it instead.
+            print(f"[WARM-UP] charts failed, they will load on first use instead: {e}")
+    refresher = asyncio.get_running_loop().create_task(hierarchy_index.run())
+    try:
+        yield
+    finally:
+        await conversations.shutdown(WORKER_SHUTDOWN_TIMEOUT)
+        refresher.cancel()
+        await graph_client.close()
+        await hierarchy_db.close()
+        await attendance_db.close()
+        chart_executor.shutdown(wait=False)
+
+
+app = Starlette(routes=[
+    Route('/webhook', webhook, methods=['GET', 'POST']),
+    Route('/health', health_check, methods=['GET']),
+    Route('/metrics', metrics, methods=['GET']),
+], lifespan=lifespan)
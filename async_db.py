@@ -0,0 +1,125 @@
+# async_db.py
+# aiomysql counterparts of db_pool.py, attendance.py and hierarchy.py for the asyncio app (asgi_app.py).
+import asyncio
+import time
+
+import pymysql
+
+from attendance import (DAILY_STATUS_COUNTS_QUERY, TODAYS_ATTENDANCE_QUERY, TODAYS_STATUS_COUNTS_QUERY, count_statuses,
+                        in_placeholders)
+from config import HIERARCHY_MAX_AGE, HIERARCHY_POLL_INTERVAL
+from hierarchy import CHANGE_MARKER_QUERY, UPDATE_TIME_QUERY, USERS_QUERY, HierarchySnapshot
+from metrics import db_query_seconds
+
+
+# --- CONNECTION POOL ---
+class AsyncDatabase:
+    def __init__(self, config, name, min_size, max_size, max_lifetime):
+        # config: one of the DB_*_CONFIG dicts from config.py; rows always come back as dicts.
+        self.config = {key: value for key, value in config.items() if key != 'cursorclass'}
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self._pool = None
+
+    async def start(self):
+        import aiomysql
+
+        self._pool = await aiomysql.create_pool(minsize=self.min_size, maxsize=self.max_size,
+                                                pool_recycle=int(self.max_lifetime), autocommit=True,
+                                                cursorclass=aiomysql.DictCursor, **self.config)
+
+    async def fetchall(self, query, params=()):
+        async with self._pool.acquire() as conn, conn.cursor() as cursor:
+            await cursor.execute(query, params)
+            return list(await cursor.fetchall() or [])
+
+    async def fetchone(self, query, params=()):
+        async with self._pool.acquire() as conn, conn.cursor() as cursor:
+            await cursor.execute(query, params)
+            return await cursor.fetchone()
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+
+    def stats(self):
+        if self._pool is None:
+            return {"size": 0, "idle": 0, "in_use": 0, "max_size": self.max_size}
+        size, idle = self._pool.size, self._pool.freesize
+        return {"size": size, "idle": idle, "in_use": size - idle, "max_size": self.max_size}
+
+
+# --- ATTENDANCE QUERIES ---
+async def fetch_todays_attendance_rows(db, supervisor_names):
+    with db_query_seconds.time('todays_attendance_rows'):
+        return await db.fetchall(in_placeholders(TODAYS_ATTENDANCE_QUERY, supervisor_names), list(supervisor_names))
+
+
+async def fetch_todays_status_counts(db, supervisor_names):
+    with db_query_seconds.time('todays_status_counts'):
+        rows = await db.fetchall(in_placeholders(TODAYS_STATUS_COUNTS_QUERY, supervisor_names),
+                                 list(supervisor_names))
+    return count_statuses(rows)
+
+
+async def fetch_daily_status_counts(db, start, end):
+    with db_query_seconds.time('daily_status_counts'):
+        return await db.fetchall(DAILY_STATUS_COUNTS_QUERY, (start.isoformat(), end.isoformat()))
+
+
+# --- HIERARCHY SNAPSHOT ---
+# The asyncio version of hierarchy.HierarchyIndex: same snapshot and change-marker rules, refreshed
+# by a task on the event loop instead of a thread.
+class AsyncHierarchyIndex:
+    def __init__(self, db, poll_interval=HIERARCHY_POLL_INTERVAL, max_age=HIERARCHY_MAX_AGE):
+        self._db = db
+        self.poll_interval = poll_interval
+        self.max_age = max_age
+        self._snapshot = None
+        self._marker = None
+        self._lock = asyncio.Lock()
+
+    def snapshot(self):
+        return self._snapshot
+
+    async def ensure_loaded(self):
+        # The snapshot, loading it first if startup could not; None while the database is unreachable.
+        if self._snapshot is None:
+            try:
+                await self.refresh(force=True)
+            except pymysql.MySQLError as e:
+                print(f"[HIERARCHY] Could not load the user table: {e}")
+        return self._snapshot
+
+    async def refresh(self, force=False):
+        async with self._lock:
+            marker = await self._read_change_marker()
+            if force or self._snapshot is None or marker != self._marker or self.age() > self.max_age:
+                with db_query_seconds.time('hierarchy_snapshot'):
+                    users = await self._db.fetchall(USERS_QUERY)
+                self._snapshot = HierarchySnapshot(users)
+                self._marker = marker
+                print(f"[HIERARCHY] Loaded {len(users)} users")
+
+    def age(self):
+        snapshot = self._snapshot
+        return None if snapshot is None else time.monotonic() - snapshot.loaded_at
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except pymysql.MySQLError as e:
+                print(f"[HIERARCHY] Refresh failed, serving previous snapshot: {e}")
+
+    async def _read_change_marker(self):
+        marker = dict(await self._db.fetchone(CHANGE_MARKER_QUERY) or {})
+        try:
+            marker.update(await self._db.fetchone(UPDATE_TIME_QUERY) or {})
+        except pymysql.MySQLError:
+            pass
+        return tuple(sorted(marker.items()))
@@ -0,0 +1,175 @@
+# attendance.py
+from db_pool import attendance_pool, hierarchy_pool
+from metrics import db_query_seconds
+
+PRESENT_STATUS = 'Active'
+NO_BAS_TODAY = "No BAs found assigned to the specified team(s) today."
+UNASSIGNED_NAME = "Unassigned"
+UNASSIGNED_ROLE = "No manager"
+
+
+# --- SQL ---
+# Shared with the asyncio queries in async_db.py; {placeholders} is filled by in_placeholders().
+TODAYS_ATTENDANCE_QUERY = "SELECT Supervisor, `BA Name`, `Store Name`, `BA Status` FROM V_NFL_BA_ATTENDANCE WHERE Supervisor IN ({placeholders}) AND `Date` = CURDATE()"
+TODAYS_STATUS_COUNTS_QUERY = "SELECT Supervisor, `BA Status`, COUNT(*) AS ba_count FROM V_NFL_BA_ATTENDANCE WHERE Supervisor IN ({placeholders}) AND `Date` = CURDATE() GROUP BY Supervisor, `BA Status`"
+SUPERVISOR_TEAM_LEADS_QUERY = "SELECT s.user_id, s.name, m.user_id AS lead_id, m.name AS lead_name, m.role AS lead_role FROM user s LEFT JOIN user m ON m.user_id = s.manager_id WHERE s.role = 'Supervisor' ORDER BY m.user_id, s.user_id"
+# Completed days only ([start, end) with end <= today); feeds the trend rollup store.
+DAILY_STATUS_COUNTS_QUERY = "SELECT `Date` AS day, Supervisor, `BA Status`, COUNT(*) AS ba_count FROM V_NFL_BA_ATTENDANCE WHERE `Date` >= %s AND `Date` < %s GROUP BY `Date`, Supervisor, `BA Status`"
+
+
+def in_placeholders(query, values):
+    return query.format(placeholders=', '.join(['%s'] * len(values)))
+
+
+# --- QUERIES ---
+@db_query_seconds.timed('todays_attendance_rows')
+def fetch_todays_attendance_rows(supervisor_names):
+    with attendance_pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(in_placeholders(TODAYS_ATTENDANCE_QUERY, supervisor_names), list(supervisor_names))
+        return cursor.fetchall() or []
+
+
+@db_query_seconds.timed('todays_status_counts')
+def fetch_todays_status_counts(supervisor_names):
+    # One grouped scan of today's rows instead of one query per team lead or supervisor.
+    with attendance_pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(in_placeholders(TODAYS_STATUS_COUNTS_QUERY, supervisor_names), list(supervisor_names))
+        return count_statuses(cursor.fetchall() or [])
+
+
+@db_query_seconds.timed('daily_status_counts')
+def fetch_daily_status_counts(start, end):
+    with attendance_pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(DAILY_STATUS_COUNTS_QUERY, (start.isoformat(), end.isoformat()))
+        return cursor.fetchall() or []
+
+
+@db_query_seconds.timed('supervisor_team_leads')
+def fetch_supervisor_team_leads():
+    with hierarchy_pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(SUPERVISOR_TEAM_LEADS_QUERY)
+        return cursor.fetchall() or []
+
+
+# --- AGGREGATION ---
+def count_statuses(rows):
+    # rows from TODAYS_STATUS_COUNTS_QUERY -> {supervisor: {'present': n, 'absent': m}}
+    counts = {}
+    for row in rows:
+        sup_counts = counts.setdefault(row['Supervisor'], {'present': 0, 'absent': 0})
+        key = 'present' if row['BA Status'] == PRESENT_STATUS else 'absent'
+        sup_counts[key] += int(row['ba_count'])
+    return counts
+
+
+def summarize_attendance(supervisor_names, todays_bas):
+    stats = {name: {'present': 0, 'absent': 0, 'present_names': [], 'absent_names': []} for name in
+             supervisor_names}
+    for ba in todays_bas:
+        supervisor = ba.get('Supervisor')
+        if supervisor in stats:
+            ba_name, store_name = ba.get('BA Name', 'Unknown'), ba.get('Store Name', 'N/A')
+            if ba.get('BA Status') == PRESENT_STATUS:
+                stats[supervisor]['present'] += 1
+                stats[supervisor]['present_names'].append((ba_name, store_name))
+            else:
+                stats[supervisor]['absent'] += 1
+                stats[supervisor]['absent_names'].append((ba_name, store_name))
+    total_present = sum(s['present'] for s in stats.values())
+    total_absent = sum(s['absent'] for s in stats.values())
+    final_stats = {
+        'present': total_present, 'absent': total_absent,
+        'present_names': [n for s in stats.values() for n in s['present_names']],
+        'absent_names': [n for s in stats.values() for n in s['absent_names']]
+    }
+    return format_attendance_summary(total_present, total_absent), final_stats, stats
+
+
+def describe_attendance(total_present, total_absent):
+    if total_present + total_absent == 0:
+        return NO_BAS_TODAY
+    return format_attendance_summary(total_present, total_absent)
+
+
+def format_attendance_summary(total_present, total_absent):
+    total_ba = total_present + total_absent
+    percentage = (total_present / total_ba * 100) if total_ba > 0 else 0
+    summary = f"✅ Present: *{total_present}*\n❌ Absent: *{total_absent}*\n👥 Total BAs: *{total_ba}*\n📊 Attendance Rate: *{percentage:.0f}%*"
+    return summary.strip()
+
+
+def build_company_rollup(supervisors, counts):
+    # supervisors: rows shaped like fetch_supervisor_team_leads(); counts: from fetch_todays_status_counts().
+    # Supervisors without a manager go in a last "Unassigned" entry so the breakdown adds up to the totals.
+    team_leads = {}
+    supervisor_stats = {}
+    for sup in supervisors:
+        sup_counts = counts.get(sup['name'], {'present': 0, 'absent': 0})
+        supervisor_stats[sup['name']] = sup_counts
+        lead_id = sup['lead_id']
+        lead = team_leads.get(lead_id)
+        if lead is None:
+            lead = team_leads[lead_id] = _supervisor_group(lead_id, sup['lead_name'], sup['lead_role'], [])
+        lead['supervisors'].append({'user_id': sup['user_id'], 'name': sup['name'], **sup_counts})
+        lead['present'] += sup_counts['present']
+        lead['absent'] += sup_counts['absent']
+    unassigned = team_leads.pop(None, None)
+    return {
+        'present': sum(s['present'] for s in supervisor_stats.values()),
+        'absent': sum(s['absent'] for s in supervisor_stats.values()),
+        'team_leads': list(team_leads.values()) + ([unassigned] if unassigned else []),
+        'supervisors': supervisor_stats,
+    }
+
+
+def build_org_rollup(snapshot, counts):
+    # Any-depth version of build_company_rollup over a hierarchy.HierarchySnapshot: 'team_leads' holds the
+    # top layer of the org (zonal heads, regional heads or team leads) and 'totals' every node's counts.
+    # Supervisors outside that layer are listed as a team under their manager (e.g. an Executive, counting
+    # only those supervisors) or as "Unassigned", so every supervisor is in exactly one entry.
+    totals = snapshot.rollup(counts)
+    team_leads = [org_node(snapshot, totals, user['user_id']) for user in snapshot.top_managers()]
+    unassigned = None
+    for manager_id, supervisors in snapshot.ungrouped_supervisors().items():
+        manager = snapshot.by_id.get(manager_id, {})
+        group = _supervisor_group(manager_id, manager.get('name'), manager.get('role'),
+                                  [_org_entry(snapshot, totals, sup) for sup in supervisors])
+        group['present'] = sum(sup['present'] for sup in group['supervisors'])
+        group['absent'] = sum(sup['absent'] for sup in group['supervisors'])
+        if manager_id is None:
+            unassigned = group
+        else:
+            team_leads.append(group)
+    return {
+        'present': sum(c['present'] for c in counts.values()),
+        'absent': sum(c['absent'] for c in counts.values()),
+        'team_leads': team_leads + ([unassigned] if unassigned else []),
+        'supervisors': counts,
+        'totals': totals,
+    }
+
+
+def _supervisor_group(user_id, name, role, supervisors):
+    # A team-lead entry holding just these supervisors; user_id None is the "Unassigned" group.
+    if user_id is None:
+        name, role = UNASSIGNED_NAME, UNASSIGNED_ROLE
+    return {'user_id': user_id, 'name': name, 'role': role, 'present': 0, 'absent': 0, 'team_lead': True,
+            'managers': [], 'supervisors': supervisors}
+
+
+def org_node(snapshot, totals, user_id):
+    # One drill-down level: a manager's totals and direct reports, split into managers and supervisors.
+    user = snapshot.by_id.get(user_id)
+    if user is None:
+        return None
+    return dict(_org_entry(snapshot, totals, user),
+                managers=[_org_entry(snapshot, totals, u) for u in snapshot.manager_reports(user_id)],
+                supervisors=[_org_entry(snapshot, totals, u) for u in snapshot.direct_reports(user_id)
+                             if u.get('role') == 'Supervisor'])
+
+
+def _org_entry(snapshot, totals, user):
+    # team_lead: no managers below, so drilling in opens the supervisor-level team report.
+    return {'user_id': user['user_id'], 'name': user['name'], 'role': user['role'],
+            'team_lead': not snapshot.manager_reports(user['user_id']),
+            **totals.get(user['user_id'], {'present': 0, 'absent': 0})}
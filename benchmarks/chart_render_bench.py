@@ -0,0 +1,87 @@
+# benchmarks/chart_render_bench.py
+# Micro-benchmark: render time and PNG size per chart, pyplot implementation vs DonutChartRenderer.
+#   python benchmarks/chart_render_bench.py [--iterations 20] [--size 800] [--compression 6] [--palette 64]
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chart_renderer import DonutChartRenderer  # noqa: E402
+
+CASES = [
+    ({'Present': 42, 'Absent': 13}, "Attendance for Supervisor Name"),
+    ({'Present': 380, 'Absent': 96}, "Team Attendance for Team Lead Name"),
+    ({'Present': 5120, 'Absent': 731}, "NFL Attendance Report"),
+    ({'Present': 12, 'Absent': 0}, "Attendance for Supervisor Name"),
+]
+
+
+def legacy_pyplot_chart(data, title):
+    # The pyplot-based chart that main.py rendered before DonutChartRenderer, kept for comparison.
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.patheffects as path_effects
+    import matplotlib.pyplot as plt
+
+    sorted_data = dict(sorted(data.items()))
+    labels = sorted_data.keys()
+    sizes = list(sorted_data.values())
+    color_map = {'Present': '#2ECC71', 'Absent': '#E74C3C'}
+    colors = [color_map[label] for label in labels]
+    explode = tuple([0.03] * len(labels))
+    fig, ax = plt.subplots(figsize=(10, 10), subplot_kw=dict(aspect="equal"))
+    total = sum(sizes)
+    wedges, texts, autotexts = ax.pie(
+        sizes, labels=labels, colors=colors, autopct=lambda pct: f'{int(round(pct * total / 100.0))}',
+        startangle=90, pctdistance=0.8, explode=explode, shadow=True,
+        wedgeprops=dict(width=0.4, edgecolor='w', linewidth=2),
+        textprops={'fontsize': 16, 'weight': 'bold'}
+    )
+    plt.setp(autotexts, size=20, weight="bold", color='white')
+    for autotext in autotexts:
+        autotext.set_path_effects([path_effects.withStroke(linewidth=3, foreground='black')])
+    plt.setp(texts, size=18, weight="bold", color='#363636')
+    ax.set_title(title, fontsize=24, pad=25, weight='bold', color='#333333')
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', dpi=150, transparent=True)
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def measure(render, iterations):
+    render(*CASES[0])  # warm fonts and caches outside the timed loop
+    rows = []
+    for data, title in CASES:
+        timings = []
+        png = b''
+        for _ in range(iterations):
+            started = time.perf_counter()
+            png = render(data, title)
+            timings.append((time.perf_counter() - started) * 1000)
+        rows.append((data, statistics.mean(timings), statistics.median(timings), max(timings), len(png)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chart render time and PNG size.")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--size', type=int, default=800)
+    parser.add_argument('--compression', type=int, default=6)
+    parser.add_argument('--palette', type=int, default=64)
+    args = parser.parse_args()
+
+    renderer = DonutChartRenderer(args.size, args.compression, args.palette)
+    implementations = [("pyplot (legacy)", legacy_pyplot_chart), (renderer.cache_token, renderer.render)]
+    print(f"{'implementation':<28} {'chart':<28} {'mean ms':>9} {'median ms':>10} {'max ms':>8} {'PNG KB':>8}")
+    for name, render in implementations:
+        for data, mean_ms, median_ms, max_ms, png_size in measure(render, args.iterations):
+            chart = f"P={data['Present']} A={data['Absent']}"
+            print(f"{name:<28} {chart:<28} {mean_ms:>9.1f} {median_ms:>10.1f} {max_ms:>8.1f} {png_size / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
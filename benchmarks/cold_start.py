@@ -0,0 +1,108 @@
+# benchmarks/cold_start.py
+# Cold start of one worker process: import time of main.py, warm-up time, and time to the first
+# Executive report (donut chart) and first trend report (matplotlib line chart), with and without
+# main.warm_up(). Each run is a fresh interpreter against the fake Graph API and a seeded SQLite org.
+#   python benchmarks/cold_start.py [--runs 3] [--fresh-font-cache] [--json out.json]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_graph_api import FakeGraphApi  # noqa: E402
+from benchmarks.sqlite_fixture import SQLiteConnection, seed_org  # noqa: E402
+
+MODES = ("cold", "warmed")
+PHASES = ("import", "warm_up", "first_report", "first_trend", "total")
+
+
+# --- CHILD PROCESS ---
+def reply_message(sender, option_id):
+    return {"from": sender, "id": f"wamid.{uuid.uuid4().hex}", "type": "interactive",
+            "interactive": {"type": "list_reply", "list_reply": {"id": option_id, "title": option_id[:24]}}}
+
+
+def run_child(mode, db_path, executive_phone):
+    # Everything before `import main` is harness setup and is not counted.
+    fake_graph = FakeGraphApi(latency=0.0, jitter=0.0)
+    os.environ["GRAPH_API_BASE_URL"] = fake_graph.start()
+    os.environ["DEDUP_BACKEND"] = "memory"
+    os.environ["TREND_STORE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="whatsapp-cold-"), "trends.sqlite3")
+    for name, value in (("ACCESS_TOKEN", "bench-token"), ("PHONE_NUMBER_ID", "100000000000000"),
+                        ("VERIFY_TOKEN", "bench"), ("DB_HIERARCHY_PORT", "3306"), ("DB_ATTENDANCE_PORT", "3306")):
+        os.environ.setdefault(name, value)
+    import db_pool
+    db_pool.hierarchy_pool.reconfigure(lambda: SQLiteConnection(db_path))
+    db_pool.attendance_pool.reconfigure(lambda: SQLiteConnection(db_path))
+
+    started = time.perf_counter()
+    import main
+    result = {"import": time.perf_counter() - started, "warm_up": 0.0,
+              "matplotlib_at_import": "matplotlib" in sys.modules}
+    if mode == "warmed":
+        step = time.perf_counter()
+        main.warm_up()
+        result["warm_up"] = time.perf_counter() - step
+    for phase, option_id in (("first_report", "exec_view_report"), ("first_trend", "exec_view_trends")):
+        step = time.perf_counter()
+        main.process_message_in_background(executive_phone, [reply_message(executive_phone, option_id)])
+        result[phase] = time.perf_counter() - step
+    result["total"] = time.perf_counter() - started
+    result["graph_api"] = fake_graph.stats()
+    fake_graph.stop()
+    print(json.dumps(result))
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker cold start with and without warm-up.")
+    parser.add_argument('--runs', type=int, default=3, help="fresh processes per mode")
+    parser.add_argument('--fresh-font-cache', action='store_true',
+                        help="give every run an empty MPLCONFIGDIR, like a new container")
+    parser.add_argument('--team-leads', type=int, default=12)
+    parser.add_argument('--supervisors-per-lead', type=int, default=8)
+    parser.add_argument('--bas-per-supervisor', type=int, default=15)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--db-path', help=argparse.SUPPRESS)
+    parser.add_argument('--phone', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child, args.db_path, args.phone)
+        return
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="whatsapp-bench-"), "org.sqlite3")
+    org = seed_org(db_path, 1, args.team_leads, args.supervisors_per_lead, args.bas_per_supervisor, args.days)
+    phone = org['Executive'][0]['phone']
+    results = {mode: [] for mode in MODES}
+    for _ in range(args.runs):
+        for mode in MODES:
+            env = dict(os.environ)
+            if args.fresh_font_cache:
+                env["MPLCONFIGDIR"] = tempfile.mkdtemp(prefix="mplconfig-")
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, '--db-path', db_path,
+                                  '--phone', phone], env=env, capture_output=True, text=True, check=True).stdout
+            results[mode].append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"Median of {args.runs} fresh processes per mode (seconds)"
+          f"{', empty font cache' if args.fresh_font_cache else ''}:")
+    print(f"{'mode':<8}" + "".join(f"{phase:>14}" for phase in PHASES))
+    summary = {}
+    for mode in MODES:
+        summary[mode] = {phase: statistics.median(run[phase] for run in results[mode]) for phase in PHASES}
+        print(f"{mode:<8}" + "".join(f"{summary[mode][phase]:>14.3f}" for phase in PHASES))
+    print(f"matplotlib imported by `import main`: {results['cold'][0]['matplotlib_at_import']}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"median": summary, "runs": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/fake_graph_api.py
+# Local stand-in for the WhatsApp Cloud API: POST /{phone_number_id}/messages and /media with
+# configurable latency and a fraction of requests answered 429 + Retry-After.
+#   python benchmarks/fake_graph_api.py --port 8089 --latency 0.08 --throttle-rate 0.02
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGraphApi:
+    def __init__(self, latency=0.05, jitter=0.0, throttle_rate=0.0, retry_after=0.5, host='127.0.0.1', port=0,
+                 seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-graph-api", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: dict(values) for endpoint, values in self._stats.items()}
+
+    # --- INTERNALS ---
+    def _respond(self, endpoint):
+        # Returns (status, headers, body) after sleeping for the configured latency.
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            throttled = self._random.random() < self.throttle_rate
+            values = self._stats.setdefault(endpoint, {"requests": 0, "throttled": 0})
+            values["requests"] += 1
+            values["throttled"] += throttled
+            object_id = next(self._ids)
+        time.sleep(delay)
+        if throttled:
+            body = {"error": {"message": "(#130429) Rate limit hit", "type": "OAuthException", "code": 130429}}
+            return 429, {"Retry-After": str(self.retry_after)}, body
+        if endpoint == "media":
+            return 200, {}, {"id": f"media-{object_id}"}
+        if endpoint == "messages":
+            return 200, {}, {"messaging_product": "whatsapp", "messages": [{"id": f"wamid.fake-{object_id}"}]}
+        return 404, {}, {"error": {"message": f"Unknown endpoint {endpoint}"}}
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like graph.facebook.com
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, headers, body = fake._respond(self.path.rstrip('/').rsplit('/', 1)[-1])
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake WhatsApp Cloud API server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="+/- seconds of uniform latency jitter")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument('--retry-after', type=float, default=0.5, help="Retry-After seconds sent with a 429")
+    args = parser.parse_args()
+    fake = FakeGraphApi(args.latency, args.jitter, args.throttle_rate, args.retry_after, args.host, args.port)
+    print(f"Fake Graph API listening on {fake.base_url} (set GRAPH_API_BASE_URL to this)")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(fake.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# benchmarks/load_test.py
+# End-to-end load test: replays webhook conversations for the Supervisor, PM and Executive flows
+# (report plus drill-down taps) through the Flask app, against the fake Graph API and a seeded SQLite org.
+# Reports messages/second and p50/p99 latency per flow, from webhook POST to the end of processing.
+#   python benchmarks/load_test.py [--sessions 300] [--clients 16] [--mix executive=1,pm=3,supervisor=6]
+#                                  [--graph-latency 0.08] [--throttle-rate 0.01] [--team-leads 12] [--json out.json]
+import argparse
+import json
+import math
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_graph_api import FakeGraphApi  # noqa: E402
+from benchmarks.sqlite_fixture import SQLiteConnection, seed_org  # noqa: E402
+
+FLOWS = ("supervisor_report", "pm_report", "executive_report", "drill_team", "drill_supervisor", "drill_ba_list")
+
+
+# --- CONVERSATION SCRIPTS ---
+def text_message(sender):
+    return {"from": sender, "id": f"wamid.{uuid.uuid4().hex}", "type": "text", "text": {"body": "hi"}}
+
+
+def reply_message(sender, reply_type, option_id):
+    return {"from": sender, "id": f"wamid.{uuid.uuid4().hex}", "type": "interactive",
+            "interactive": {"type": reply_type, reply_type: {"id": option_id, "title": option_id[:24]}}}
+
+
+def build_session(role, org, supervisors_by_lead, rnd):
+    # A list of (flow, message) steps one user sends, each tap following the report that offered it.
+    if role == 'supervisor':
+        user = rnd.choice(org['Supervisor'])
+        phone = user['phone']
+        return [("supervisor_report", text_message(phone)),
+                ("drill_ba_list", reply_message(phone, 'button_reply', f"view_present-{user['user_id']}"))]
+    if role == 'pm':
+        user = rnd.choice(org['PM'])
+        phone = user['phone']
+        supervisor = rnd.choice(supervisors_by_lead[user['user_id']])
+        return [("pm_report", text_message(phone)),
+                ("drill_supervisor", reply_message(phone, 'list_reply', f"view_sup-{supervisor['user_id']}")),
+                ("drill_ba_list", reply_message(phone, 'button_reply', f"view_absent-{supervisor['user_id']}"))]
+    if role == 'executive':
+        phone = rnd.choice(org['Executive'])['phone']
+        lead = rnd.choice(org['PM'])
+        supervisor = rnd.choice(supervisors_by_lead[lead['user_id']])
+        return [("executive_report", reply_message(phone, 'list_reply', 'exec_view_report')),
+                ("drill_team", reply_message(phone, 'list_reply', f"view_team-{lead['user_id']}")),
+                ("drill_supervisor", reply_message(phone, 'list_reply', f"view_sup-{supervisor['user_id']}")),
+                ("drill_ba_list", reply_message(phone, 'button_reply', f"view_present-{supervisor['user_id']}"))]
+    raise ValueError(f"Unknown role in mix: {role}")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        role, _, weight = part.partition('=')
+        mix[role.strip()] = float(weight or 1)
+    return mix
+
+
+# --- REPLAY ---
+class Replay:
+    def __init__(self, app_module, clients, think_time, timeout):
+        self.main = app_module
+        self.clients = clients
+        self.think_time = think_time
+        self.timeout = timeout
+        self.latencies = {flow: [] for flow in FLOWS}
+        self.counts = {"posted": 0, "deferred": 0, "timed_out": 0}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._install_tracker()
+
+    def run(self, sessions):
+        work = queue.Queue()
+        for session in sessions:
+            work.put(session)
+        threads = [threading.Thread(target=self._client, args=(work,), daemon=True) for _ in range(self.clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+    def _install_tracker(self):
+        # The webhook resolves process_message_in_background at call time, so wrapping the module
+        # attribute marks each message done when its worker task returns.
+        original = self.main.process_message_in_background
+
+        def tracked(sender_phone, messages):
+            try:
+                original(sender_phone, messages)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    for message in messages:
+                        pending = self._pending.pop(message['id'], None)
+                        if pending:
+                            pending[1].append(finished)
+                            pending[0].set()
+
+        self.main.process_message_in_background = tracked
+
+    def _client(self, work):
+        client = self.main.app.test_client()
+        while True:
+            try:
+                session = work.get_nowait()
+            except queue.Empty:
+                return
+            for flow, message in session:
+                # Like a real user, the next tap is only sent once the previous reply has gone out.
+                if not self._send(client, flow, message):
+                    break
+                if self.think_time:
+                    time.sleep(self.think_time)
+
+    def _send(self, client, flow, message):
+        done, finished = threading.Event(), []
+        with self._lock:
+            self._pending[message['id']] = (done, finished)
+        payload = {"object": "whatsapp_business_account",
+                   "entry": [{"changes": [{"field": "messages", "value": {"messages": [message]}}]}]}
+        started = time.perf_counter()
+        while True:
+            status = client.post('/webhook', json=payload).status_code
+            with self._lock:
+                self.counts["posted"] += 1
+            if status != 503:
+                break
+            with self._lock:
+                self.counts["deferred"] += 1
+            time.sleep(0.05)  # Meta redelivers after a 503; retry the same message id
+        if not done.wait(self.timeout):
+            with self._lock:
+                self._pending.pop(message['id'], None)
+                self.counts["timed_out"] += 1
+            return False
+        with self._lock:
+            self.latencies[flow].append(finished[0] - started)
+        return True
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile.
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Replay webhook traffic against local stand-ins.")
+    parser.add_argument('--sessions', type=int, default=300, help="user conversations to replay")
+    parser.add_argument('--warmup', type=int, default=20, help="conversations replayed before measuring")
+    parser.add_argument('--clients', type=int, default=16, help="users talking to the bot at once")
+    parser.add_argument('--mix', default="executive=1,pm=3,supervisor=6")
+    parser.add_argument('--think-time', type=float, default=0.0, help="seconds between a reply and the next tap")
+    parser.add_argument('--timeout', type=float, default=60.0, help="seconds to wait for a message to finish")
+    parser.add_argument('--graph-latency', type=float, default=0.08)
+    parser.add_argument('--graph-jitter', type=float, default=0.02)
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of Graph calls answered 429")
+    parser.add_argument('--retry-after', type=float, default=0.5)
+    parser.add_argument('--executives', type=int, default=2)
+    parser.add_argument('--team-leads', type=int, default=12)
+    parser.add_argument('--supervisors-per-lead', type=int, default=8)
+    parser.add_argument('--bas-per-supervisor', type=int, default=15)
+    parser.add_argument('--days', type=int, default=30, help="days of attendance history in the fixture")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    fake_graph = FakeGraphApi(args.graph_latency, args.graph_jitter, args.throttle_rate, args.retry_after,
+                              seed=args.seed)
+    # config.py reads the environment at import time, so everything is set before the app is imported.
+    os.environ["GRAPH_API_BASE_URL"] = fake_graph.start()
+    os.environ["DEDUP_BACKEND"] = "memory"
+    for name, value in (("ACCESS_TOKEN", "bench-token"), ("PHONE_NUMBER_ID", "100000000000000"),
+                        ("VERIFY_TOKEN", "bench"), ("DB_HIERARCHY_PORT", "3306"), ("DB_ATTENDANCE_PORT", "3306"),
+                        ("WHATSAPP_SEND_PROCESSES", "1")):
+        os.environ.setdefault(name, value)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="whatsapp-bench-"), "org.sqlite3")
+    seed_started = time.perf_counter()
+    org = seed_org(db_path, args.executives, args.team_leads, args.supervisors_per_lead, args.bas_per_supervisor,
+                   args.days, seed=args.seed)
+    print(f"Seeded {sum(len(users) for users in org.values())} users, "
+          f"{len(org['Supervisor']) * args.bas_per_supervisor} BAs x {args.days} days "
+          f"in {time.perf_counter() - seed_started:.1f}s")
+
+    import db_pool
+    db_pool.hierarchy_pool.reconfigure(lambda: SQLiteConnection(db_path))
+    db_pool.attendance_pool.reconfigure(lambda: SQLiteConnection(db_path))
+    import main as app_module
+
+    rnd = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    roles, weights = list(mix), list(mix.values())
+    supervisors_by_lead = {}
+    for supervisor in org['Supervisor']:
+        supervisors_by_lead.setdefault(supervisor['manager_id'], []).append(supervisor)
+    replay = Replay(app_module, args.clients, args.think_time, args.timeout)
+    if args.warmup:
+        replay.run([build_session(role, org, supervisors_by_lead, rnd)
+                    for role in rnd.choices(roles, weights, k=args.warmup)])
+        replay.latencies = {flow: [] for flow in FLOWS}
+        replay.counts = dict.fromkeys(replay.counts, 0)
+    sessions = [build_session(role, org, supervisors_by_lead, rnd)
+                for role in rnd.choices(roles, weights, k=args.sessions)]
+    elapsed = replay.run(sessions)
+    app_module.message_workers.shutdown(timeout=args.timeout)
+    fake_graph.stop()
+
+    measured = sum(len(values) for values in replay.latencies.values())
+    results = {"messages": measured, "seconds": elapsed, "messages_per_second": measured / elapsed,
+               "clients": args.clients, "mix": mix, "counts": replay.counts, "flows": {},
+               "graph_api": fake_graph.stats()}
+    print(f"\n{measured} messages in {elapsed:.2f}s -> {measured / elapsed:.1f} msg/s "
+          f"({args.clients} clients, mix {args.mix})")
+    print(f"{'flow':<20} {'count':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for flow in FLOWS:
+        values = replay.latencies[flow]
+        if not values:
+            continue
+        row = {"count": len(values), "p50_ms": percentile(values, 50) * 1000, "p99_ms": percentile(values, 99) * 1000,
+               "max_ms": max(values) * 1000}
+        results["flows"][flow] = row
+        print(f"{flow:<20} {row['count']:>6} {row['p50_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}")
+    print(f"webhook posts: {replay.counts['posted']}, deferred (503): {replay.counts['deferred']}, "
+          f"timed out: {replay.counts['timed_out']}")
+    print("fake Graph API:", json.dumps(fake_graph.stats()))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
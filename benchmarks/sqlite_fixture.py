@@ -0,0 +1,107 @@
+# benchmarks/sqlite_fixture.py
+# Seeded SQLite stand-in for the hierarchy `user` table and the V_NFL_BA_ATTENDANCE view, plus a
+# pymysql-shaped connection so db_pool can be pointed at it with pool.reconfigure().
+import datetime
+import random
+import re
+import sqlite3
+
+import pymysql
+
+_RIGHT = re.compile(r'\bRIGHT\(')
+
+
+class SQLiteCursor:
+    # The subset of pymysql's DictCursor used by the app: %s params, dict rows, context manager.
+    def __init__(self, connection):
+        self._cursor = connection.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+    def execute(self, query, params=()):
+        query = _RIGHT.sub('MYSQL_RIGHT(', query.replace('%s', '?'))
+        try:
+            self._cursor.execute(query, tuple(params))
+        except sqlite3.OperationalError as e:
+            # e.g. information_schema lookups; callers already handle pymysql errors.
+            raise pymysql.err.ProgrammingError(str(e))
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def _row(self, row):
+        if row is None:
+            return None
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+
+class SQLiteConnection:
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.create_function("CURDATE", 0, lambda: datetime.date.today().isoformat())
+        self._db.create_function("MYSQL_RIGHT", 2, lambda value, n: None if value is None else str(value)[-n:])
+
+    def cursor(self):
+        return SQLiteCursor(self._db)
+
+    def ping(self, reconnect=False):
+        self._db.execute("SELECT 1")
+
+    def close(self):
+        self._db.close()
+
+
+def seed_org(path, executives=2, team_leads=12, supervisors_per_lead=8, bas_per_supervisor=15, days=30,
+             present_ratio=0.85, seed=1):
+    # Returns {'Executive': [users], 'PM': [...], 'Supervisor': [...]} for building webhook payloads.
+    rnd = random.Random(seed)
+    today = datetime.date.today()
+    users = {'Executive': [], 'PM': [], 'Supervisor': []}
+    user_ids = iter(range(1, 10 ** 7))
+
+    def add_user(name, role, manager_id):
+        user = {'user_id': next(user_ids), 'name': name, 'role': role, 'manager_id': manager_id}
+        user['phone'] = f"91{9000000000 + user['user_id']}"
+        users[role].append(user)
+        return user
+
+    for e in range(executives):
+        add_user(f"Executive {e + 1}", 'Executive', None)
+    attendance = []
+    for lead_no in range(team_leads):
+        lead = add_user(f"Team Lead {lead_no + 1}", 'PM', users['Executive'][0]['user_id'])
+        for sup_no in range(supervisors_per_lead):
+            supervisor = add_user(f"Supervisor {lead_no + 1}-{sup_no + 1}", 'Supervisor', lead['user_id'])
+            for ba_no in range(bas_per_supervisor):
+                ba_name = f"BA {lead_no + 1}-{sup_no + 1}-{ba_no + 1}"
+                store = f"Store {rnd.randint(1, 500)}"
+                for day in range(days):
+                    status = 'Active' if rnd.random() < present_ratio else 'Absent'
+                    attendance.append((supervisor['name'], ba_name, store, status,
+                                       (today - datetime.timedelta(days=day)).isoformat()))
+
+    db = sqlite3.connect(path)
+    try:
+        db.executescript("""
+            DROP TABLE IF EXISTS user;
+            DROP TABLE IF EXISTS V_NFL_BA_ATTENDANCE;
+            CREATE TABLE user (user_id INTEGER PRIMARY KEY, name TEXT, role TEXT, phone TEXT, manager_id INTEGER);
+            CREATE TABLE V_NFL_BA_ATTENDANCE (Supervisor TEXT, `BA Name` TEXT, `Store Name` TEXT,
+                                              `BA Status` TEXT, `Date` TEXT);
+            CREATE INDEX attendance_date_supervisor ON V_NFL_BA_ATTENDANCE (`Date`, Supervisor);
+        """)
+        db.executemany("INSERT INTO user VALUES (:user_id, :name, :role, :phone, :manager_id)",
+                       [user for role_users in users.values() for user in role_users])
+        db.executemany("INSERT INTO V_NFL_BA_ATTENDANCE VALUES (?, ?, ?, ?, ?)", attendance)
+        db.commit()
+    finally:
+        db.close()
+    return users
@@ -0,0 +1,268 @@
+# broadcast.py
+# Scheduled push of the day's attendance reports to every Supervisor, PM and Executive, so the morning
+# peak is one paced batch instead of everyone asking at once. Run it from cron, e.g. at 09:55:
+#   python broadcast.py
+#   python broadcast.py --roles Supervisor,PM --dry-run
+# All reports come from one DailyReport (a single attendance query) and each distinct chart is rendered
+# once. Sends go through main's uploader and message sender, so they share the Graph API client's rate
+# limit, 429 retries and chart/media cache with the webhook flows. Delivery progress is stored per
+# report date and per message of each report, so a retry round or a re-run after a crash only sends
+# the messages a manager has not received yet.
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (BROADCAST_CONCURRENCY, BROADCAST_COUNTRY_CODE, BROADCAST_MAX_ATTEMPTS, BROADCAST_PROGRESS_PATH,
+                    BROADCAST_RETRY_DELAY, BROADCAST_ROLES)
+from attendance import describe_attendance
+from report_messages import (CAPTION_LIMIT, CHART_FAILED, NO_CHART_DATA, company_summary_lines, image_payload,
+                             org_report_lines, pack_messages, supervisor_report_text, team_report_lines, text_payload)
+from report_snapshot import build_daily_report
+
+DELIVERED = "delivered"
+SENDING = "sending"
+FAILED = "failed"
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+# --- PROGRESS STORE ---
+class BroadcastProgress:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS broadcast_deliveries (report_date TEXT NOT NULL, "
+                           "phone TEXT NOT NULL, role TEXT, status TEXT NOT NULL, attempts INTEGER NOT NULL, "
+                           "parts_sent INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL, "
+                           "PRIMARY KEY (report_date, phone))")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(broadcast_deliveries)")}
+        if 'parts_sent' not in columns:
+            # Progress files from before per-message tracking.
+            self._conn.execute("ALTER TABLE broadcast_deliveries ADD COLUMN parts_sent INTEGER NOT NULL DEFAULT 0")
+
+    def delivered(self, report_date):
+        with self._lock:
+            rows = self._conn.execute("SELECT phone FROM broadcast_deliveries WHERE report_date = ? AND status = ?",
+                                      (report_date, DELIVERED)).fetchall()
+        return {row[0] for row in rows}
+
+    def parts_sent(self, report_date):
+        # {phone: messages already delivered} for reports that were started but not finished.
+        with self._lock:
+            rows = self._conn.execute("SELECT phone, parts_sent FROM broadcast_deliveries WHERE report_date = ? "
+                                      "AND status != ? AND parts_sent > 0", (report_date, DELIVERED)).fetchall()
+        return dict(rows)
+
+    def record(self, report_date, phone, role, status, attempts, parts_sent=0):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO broadcast_deliveries "
+                               "(report_date, phone, role, status, attempts, parts_sent, updated_at) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (report_date, phone, role, status, attempts, parts_sent, time.time()))
+
+    def summary(self, report_date):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM broadcast_deliveries WHERE report_date = ? "
+                                      "GROUP BY status", (report_date,)).fetchall()
+        return dict(rows)
+
+    def close(self):
+        self._conn.close()
+
+
+# --- REPORT PLAN ---
+def recipient_phone(phone, country_code=BROADCAST_COUNTRY_CODE):
+    # The user table stores local numbers in several formats; the Cloud API wants digits with a country code.
+    digits = _NON_DIGITS.sub('', str(phone or ''))
+    if len(digits) == 10:
+        digits = country_code + digits
+    return digits or None
+
+
+def plan_reports(report, snapshot, roles):
+    # One job per recipient, with the same chart titles and captions as the interactive flows so the
+    # chart cache is shared with them. Users without a phone or without report data are left out.
+    # Captions are kept as report pieces; every run packs them into the same messages, which is what
+    # lets a re-run pick up a report at the message it stopped at.
+    jobs = []
+    for role in roles:
+        for user in snapshot.by_role.get(role, []):
+            phone = recipient_phone(user.get('phone'))
+            if not phone:
+                continue
+            if role == 'Executive':
+                company = report.company
+                if not company:
+                    continue
+                chart_data = {'Present': company['present'], 'Absent': company['absent']}
+                chart_title = "NFL Attendance Report"
+                caption = list(company_summary_lines(company['team_leads']))
+            elif role == 'Supervisor':
+                stats = report.supervisor_stats.get(user['name'])
+                if stats is None:
+                    continue
+                chart_data = {'Present': stats['present'], 'Absent': stats['absent']}
+                chart_title = f"Attendance for {user['name']}"
+                caption = supervisor_report_text(user['name'], describe_attendance(stats['present'], stats['absent']))
+            else:
+                # PMs and any zonal/regional layer: their own level of the org rollup.
+                node = report.org_node(user['user_id'])
+                if not node or not (node.get('managers') or node['supervisors']):
+                    continue
+                chart_data = {'Present': node['present'], 'Absent': node['absent']}
+                summary_text = describe_attendance(node['present'], node['absent'])
+                if node.get('managers'):
+                    chart_title = f"Attendance for {user['name']}"
+                    caption = list(org_report_lines(node, summary_text))
+                else:
+                    chart_title = f"Team Attendance for {user['name']}"
+                    caption = list(team_report_lines(user['name'], summary_text, node['supervisors'],
+                                                    {s['name']: s for s in node['supervisors']}))
+            jobs.append({'phone': phone, 'role': role, 'name': user['name'], 'chart_data': chart_data,
+                         'chart_title': chart_title, 'caption': caption})
+    return jobs
+
+
+# --- BROADCASTER ---
+class Broadcaster:
+    def __init__(self, send_message, make_chart, upload_chart, progress, concurrency=BROADCAST_CONCURRENCY,
+                 max_attempts=BROADCAST_MAX_ATTEMPTS, retry_delay=BROADCAST_RETRY_DELAY):
+        # send_message(payload) -> bool; make_chart(data, title) -> image buffer or None;
+        # upload_chart(image buffer) -> media id or None.
+        self._send_message = send_message
+        self._make_chart = make_chart
+        self._upload_chart = upload_chart
+        self._progress = progress
+        self.concurrency = concurrency
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+
+    def run(self, report_date, jobs):
+        # Sends every job not yet delivered for report_date; failures are retried in later rounds. A report
+        # is its image (with the first caption chunk) followed by text chunks, and sending resumes at the
+        # first message the manager has not received, so a retry never repeats the chart or a chunk.
+        started = time.monotonic()
+        delivered_before = self._progress.delivered(report_date)
+        parts_sent = self._progress.parts_sent(report_date)
+        pending = [dict(job, parts=list(pack_messages(job['caption'], first_limit=CAPTION_LIMIT)) or [""],
+                        sent=parts_sent.get(job['phone'], 0))
+                   for job in jobs if job['phone'] not in delivered_before]
+        to_send = len(pending)
+        summary = {"report_date": report_date, "recipients": len(jobs), "skipped": len(jobs) - len(pending),
+                   "delivered": 0, "failed": 0, "retried": 0, "charts": 0}
+        print(f"[BROADCAST] {len(pending)} of {len(jobs)} reports to send for {report_date}")
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix="broadcast") as pool:
+            charts = self._render_charts(pool, [job for job in pending if not job['sent']])
+            media_ids = self._upload_charts(pool, charts)
+            summary["charts"] = len(charts)
+            for attempt in range(1, self.max_attempts + 1):
+                if not pending:
+                    break
+                if attempt > 1:
+                    summary["retried"] += len(pending)
+                    print(f"[BROADCAST] Retrying {len(pending)} failed sends in {self.retry_delay:.0f}s "
+                          f"(attempt {attempt}/{self.max_attempts})")
+                    time.sleep(self.retry_delay)
+                results = list(pool.map(lambda job: self._deliver(report_date, job, charts, media_ids, attempt),
+                                        pending))
+                pending = [job for job, ok in zip(pending, results) if not ok]
+        summary["delivered"] = to_send - len(pending)
+        summary["failed"] = len(pending)
+        summary["seconds"] = round(time.monotonic() - started, 2)
+        return summary
+
+    # --- INTERNALS ---
+    def _render_charts(self, pool, jobs):
+        # {(title, sorted counts): image buffer}; identical charts (e.g. every executive's) render once.
+        keys = list(dict.fromkeys(_chart_key(job) for job in jobs))
+        images = pool.map(lambda key: self._make_chart(dict(key[1]), key[0]), keys)
+        return dict(zip(keys, images))
+
+    def _upload_charts(self, pool, charts):
+        # {chart key: media id}; a chart whose upload failed goes out as the text fallback instead.
+        keys = [key for key, image in charts.items() if image is not None]
+        return dict(zip(keys, pool.map(lambda key: self._upload_chart(charts[key]), keys)))
+
+    def _deliver(self, report_date, job, charts, media_ids, attempt):
+        # Each delivered message is recorded before the next is sent, so a crash mid-report loses nothing.
+        phone, parts = job['phone'], job['parts']
+        try:
+            while job['sent'] < len(parts):
+                if not self._send_message(self._part_payload(job, charts, media_ids)):
+                    break
+                job['sent'] += 1
+                if job['sent'] < len(parts):
+                    self._progress.record(report_date, phone, job['role'], SENDING, attempt, job['sent'])
+        except Exception as e:
+            print(f"[BROADCAST] Error sending to {phone[-4:]}: {e}")
+        ok = job['sent'] == len(parts)
+        self._progress.record(report_date, phone, job['role'], DELIVERED if ok else FAILED, attempt, job['sent'])
+        return ok
+
+    def _part_payload(self, job, charts, media_ids):
+        index, text = job['sent'], job['parts'][job['sent']]
+        if index:
+            return text_payload(job['phone'], text)
+        key = _chart_key(job)
+        if media_ids.get(key):
+            return image_payload(job['phone'], media_ids[key], text)
+        return text_payload(job['phone'], (NO_CHART_DATA if charts.get(key) is None else CHART_FAILED) + text)
+
+
+def _chart_key(job):
+    return job['chart_title'], tuple(sorted(job['chart_data'].items()))
+
+
+# --- ENTRY POINT ---
+def main():
+    parser = argparse.ArgumentParser(description="Push today's attendance reports to all managers.")
+    parser.add_argument('--roles', default=BROADCAST_ROLES, help="comma-separated roles to send to")
+    parser.add_argument('--concurrency', type=int, default=BROADCAST_CONCURRENCY)
+    parser.add_argument('--max-attempts', type=int, default=BROADCAST_MAX_ATTEMPTS)
+    parser.add_argument('--retry-delay', type=float, default=BROADCAST_RETRY_DELAY)
+    parser.add_argument('--progress-path', default=BROADCAST_PROGRESS_PATH)
+    parser.add_argument('--dry-run', action='store_true', help="plan the reports without sending anything")
+    parser.add_argument('--json', action='store_true', help="print the summary as JSON")
+    args = parser.parse_args()
+    roles = [role.strip() for role in args.roles.split(',') if role.strip()]
+
+    import main as bot  # the Flask app module: shared Graph API client, chart cache and senders
+
+    snapshot = bot.hierarchy_index.snapshot()
+    if snapshot is None:
+        print("[BROADCAST] Could not load the user table; nothing sent.")
+        return 1
+    report = build_daily_report(snapshot.supervisor_team_leads(), snapshot)
+    jobs = plan_reports(report, snapshot, roles)
+    if args.dry_run:
+        for role in roles:
+            print(f"{role}: {sum(1 for job in jobs if job['role'] == role)} reports")
+        return 0
+
+    progress = BroadcastProgress(args.progress_path)
+    try:
+        broadcaster = Broadcaster(bot.send_whatsapp_message, bot.create_attendance_pie_chart, bot.upload_whatsapp_media,
+                                  progress, args.concurrency, args.max_attempts, args.retry_delay)
+        summary = broadcaster.run(report.report_date.isoformat(), jobs)
+        summary["progress"] = progress.summary(report.report_date.isoformat())
+    finally:
+        progress.close()
+    summary["graph_api"] = bot.graph_client.stats()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"[BROADCAST] {summary['delivered']} delivered, {summary['failed']} failed, "
+              f"{summary['retried']} retried, {summary['skipped']} already delivered earlier "
+              f"({summary['charts']} charts, {summary['seconds']}s)")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+# chart_cache.py
+import hashlib
+import io
+import json
+
+from cache import TTLCache
+
+
+class ChartImage(io.BytesIO):
+    # A rendered PNG that remembers which chart inputs produced it, so uploads can be reused.
+    def __init__(self, png_bytes, cache_key):
+        super().__init__(png_bytes)
+        self.cache_key = cache_key
+
+
+class _UploadFailed(Exception):
+    pass
+
+
+# --- CONTENT-ADDRESSED CHART CACHE ---
+class ChartCache:
+    def __init__(self, maxsize, png_ttl, media_ttl):
+        self._png = TTLCache(maxsize, png_ttl, name="chart_png")
+        self._media = TTLCache(maxsize, media_ttl, name="chart_media")
+
+    @staticmethod
+    def key(data, title, variant=""):
+        raw = json.dumps([sorted(data.items()), title, variant], ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def render(self, key, renderer):
+        # renderer() -> PNG bytes; identical concurrent renders are coalesced into one.
+        png_bytes = self._png.get_or_load(key, renderer)
+        return ChartImage(png_bytes, key) if png_bytes else None
+
+    def media_id(self, key, uploader):
+        # uploader() -> media_id or None; failed uploads are retried on the next request.
+        def load():
+            media_id = uploader()
+            if not media_id:
+                raise _UploadFailed()
+            return media_id
+        try:
+            return self._media.get_or_load(key, load)
+        except _UploadFailed:
+            return None
+
+    def cached_media_id(self, key):
+        # Lookup and store halves of media_id() for callers that upload asynchronously.
+        return self._media.get(key)
+
+    def store_media_id(self, key, media_id):
+        if media_id:
+            self._media.set(key, media_id)
+
+    def stats(self):
+        return {"png": self._png.stats(), "media": self._media.stats()}
@@ -0,0 +1,210 @@
+# chart_renderer.py
+import importlib.util
+import io
+import math
+import os
+import threading
+
+from PIL import Image, ImageDraw, ImageFont
+
+PRESENT_COLOR = '#2ECC71'
+ABSENT_COLOR = '#E74C3C'
+TITLE_COLOR = '#333333'
+LABEL_COLOR = '#363636'
+
+
+def _font_candidates():
+    # Prefer DejaVu Sans Bold (what the matplotlib charts used), found without importing matplotlib.
+    yield 'DejaVuSans-Bold.ttf'
+    spec = importlib.util.find_spec('matplotlib')
+    for location in (spec.submodule_search_locations or []) if spec else []:
+        yield os.path.join(location, 'mpl-data', 'fonts', 'ttf', 'DejaVuSans-Bold.ttf')
+
+
+def load_font(size):
+    for candidate in _font_candidates():
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+# --- PILLOW DONUT RENDERER ---
+# Renders the two-slice Present/Absent donut. Fonts, geometry and the ring mask are built once
+# per renderer and shared read-only, so render() is safe to call from many threads at once.
+class DonutChartRenderer:
+    def __init__(self, size=800, compress_level=6, palette_colors=64, supersample=2):
+        self.size = size
+        self.compress_level = compress_level
+        self.palette_colors = palette_colors
+        self.supersample = max(1, supersample)
+        self._center = (size / 2, size * 0.56)
+        self._outer = size * 0.34
+        self._inner = self._outer * 0.6
+        # Only the ring is drawn supersampled (pieslice has no anti-aliasing); text is anti-aliased by FreeType.
+        self._ring_px = int(round(2 * self._outer)) * self.supersample
+        self._ring_origin = (int(round(self._center[0] - self._outer)), int(round(self._center[1] - self._outer)))
+        self._ring_mask = self._build_ring_mask()
+        self._blank = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        self._fonts = {}
+        self._fonts_lock = threading.Lock()
+        self._value_font = self._font(int(size * 0.045))
+        self._label_font = self._font(int(size * 0.04))
+
+    @property
+    def cache_token(self):
+        return f"pil-donut:{self.size}:{self.compress_level}:{self.palette_colors}:{self.supersample}"
+
+    def render(self, data, title):
+        # data: {'Present': n, 'Absent': m}; returns PNG bytes or None when there is nothing to draw.
+        slices = [(label, data.get(label, 0)) for label in ('Absent', 'Present')]
+        total = sum(value for _, value in slices)
+        if total <= 0:
+            return None
+        colors = {'Present': PRESENT_COLOR, 'Absent': ABSENT_COLOR}
+
+        # Same geometry as the matplotlib pie: start at 12 o'clock and run counter-clockwise.
+        ring = Image.new('RGBA', (self._ring_px, self._ring_px), (0, 0, 0, 0))
+        ring_draw = ImageDraw.Draw(ring)
+        angle = -90.0
+        placed = []
+        for label, value in slices:
+            if value <= 0:
+                continue
+            sweep = 360.0 * value / total
+            start, end = angle - sweep, angle
+            ring_draw.pieslice((0, 0, self._ring_px - 1, self._ring_px - 1), start, end, fill=colors[label])
+            placed.append((label, value, start, end))
+            angle = start
+        if len(placed) > 1:
+            for _, _, start, _ in placed:
+                self._draw_separator(ring_draw, start)
+        ring.putalpha(self._ring_mask)
+        if self.supersample > 1:
+            ring = ring.reduce(self.supersample)
+
+        image = self._blank.copy()
+        image.paste(ring, self._ring_origin)
+        draw = ImageDraw.Draw(image)
+        cx, cy = self._center
+        ring_radius = (self._outer + self._inner) / 2
+        label_radius = self._outer * 1.12
+        for label, value, start, end in placed:
+            mid = math.radians((start + end) / 2)
+            draw.text((cx + ring_radius * math.cos(mid), cy + ring_radius * math.sin(mid)), str(value),
+                      font=self._value_font, fill='white', anchor='mm', stroke_width=2, stroke_fill='black')
+            anchor = 'lm' if math.cos(mid) > 0.2 else 'rm' if math.cos(mid) < -0.2 else 'mm'
+            draw.text((cx + label_radius * math.cos(mid), cy + label_radius * math.sin(mid)), label,
+                      font=self._label_font, fill=LABEL_COLOR, anchor=anchor)
+        self._draw_title(draw, title)
+
+        if self.palette_colors:
+            # Flat colours plus anti-aliased edges fit an indexed palette, roughly halving the PNG.
+            image = image.quantize(self.palette_colors, method=Image.Quantize.FASTOCTREE)
+        buf = io.BytesIO()
+        image.save(buf, format='PNG', compress_level=self.compress_level)
+        return buf.getvalue()
+
+    # --- INTERNALS ---
+    def _build_ring_mask(self):
+        size = self._ring_px
+        hole = (size - size * self._inner / self._outer) / 2
+        mask = Image.new('L', (size, size), 0)
+        draw = ImageDraw.Draw(mask)
+        draw.ellipse((0, 0, size - 1, size - 1), fill=255)
+        draw.ellipse((hole, hole, size - 1 - hole, size - 1 - hole), fill=0)
+        return mask
+
+    def _draw_separator(self, draw, angle):
+        half = self._ring_px / 2
+        rad = math.radians(angle)
+        draw.line((half, half, half + half * 1.01 * math.cos(rad), half + half * 1.01 * math.sin(rad)),
+                  fill='white', width=2 * self.supersample)
+
+    def _draw_title(self, draw, title):
+        max_width = self.size * 0.92
+        size = int(self.size * 0.055)
+        font = self._font(size)
+        while size > 10 and draw.textlength(title, font=font) > max_width:
+            size = int(size * 0.9)
+            font = self._font(size)
+        draw.text((self.size / 2, self.size * 0.09), title, font=font, fill=TITLE_COLOR, anchor='mm')
+
+    def _font(self, size):
+        font = self._fonts.get(size)
+        if font is None:
+            with self._fonts_lock:
+                font = self._fonts.get(size)
+                if font is None:
+                    font = self._fonts[size] = load_font(size)
+        return font
+
+
+# --- MATPLOTLIB FALLBACK ---
+# matplotlib is imported on first use only; it is most of a cold worker's import time.
+def colormap_palette(count, name='viridis'):
+    # Evenly spaced colormap colours without the two extremes, as seaborn.color_palette(name, count) picks them.
+    from matplotlib import colormaps
+    from matplotlib.colors import to_hex
+
+    cmap = colormaps[name]
+    return [to_hex(cmap((i + 1) / (count + 1))) for i in range(count)]
+
+
+def prime_chart_rendering(renderer):
+    # One throwaway chart of each kind: loads the donut fonts and encoders, then imports the plotting
+    # stack and its font cache ahead of the first trend or fallback chart.
+    renderer.render({'Present': 3, 'Absent': 1}, "Warm-up")
+    render_trend_figure([('2000-01-01', 50.0), ('2000-01-02', 75.0)], "Warm-up")
+
+
+def render_pie_figure(data, title, colors, size_inches=8, dpi=100):
+    # Generic pie chart through the object-oriented Figure API (no pyplot global state).
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    labels = list(data.keys())
+    sizes = list(data.values())
+    total = sum(sizes)
+    fig = Figure(figsize=(size_inches, size_inches), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(aspect='equal')
+    _, texts, autotexts = ax.pie(
+        sizes, labels=labels, colors=colors, autopct=lambda pct: f'{int(round(pct * total / 100.0))}',
+        startangle=90, pctdistance=0.8,
+        wedgeprops=dict(width=0.4, edgecolor='w', linewidth=2),
+        textprops={'fontsize': 16, 'weight': 'bold'}
+    )
+    for autotext in autotexts:
+        autotext.set(size=20, weight='bold', color='white')
+    for text in texts:
+        text.set(size=18, weight='bold', color=LABEL_COLOR)
+    ax.set_title(title, fontsize=24, pad=25, weight='bold', color=TITLE_COLOR)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', transparent=True)
+    return buf.getvalue()
+
+
+def render_trend_figure(points, title, width_inches=10, height_inches=6, dpi=100):
+    # points: [(iso day, attendance rate % or None)] in date order -> PNG bytes of a daily rate line chart.
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    days = [day[5:] for day, _ in points]
+    rates = [rate for _, rate in points]
+    fig = Figure(figsize=(width_inches, height_inches), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot(days, rates, color=PRESENT_COLOR, linewidth=3, marker='o', markersize=5)
+    ax.set_ylim(0, 100)
+    ax.set_ylabel('Attendance %', fontsize=14, color=LABEL_COLOR)
+    ax.grid(axis='y', alpha=0.3)
+    ax.spines[['top', 'right']].set_visible(False)
+    step = max(1, len(days) // 10)
+    ax.set_xticks(range(0, len(days), step), days[::step], rotation=45, ha='right')
+    ax.set_title(title, fontsize=20, pad=20, weight='bold', color=TITLE_COLOR)
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
@@ -1,5 +1,7 @@
 # config.py
 import os
+import tempfile
+
 import pymysql.cursors
 from dotenv import load_dotenv
 
@@ -11,6 +13,24 @@ ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
 PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
 VERIFY_TOKEN = os.getenv("VERIFY_TOKEN")
 
+# --- GRAPH API CLIENT ---
+# Cloud API numbers start at 80 messages/second; raise WHATSAPP_NUMBER_RATE if Meta upgrades the number.
+# The send throttle is per process, so the number's rate is split between every process that sends:
+# WHATSAPP_SEND_PROCESSES defaults to the web workers (WEB_CONCURRENCY, read by gunicorn and uvicorn) plus
+# one for broadcast.py, and each process sends at most WHATSAPP_SEND_RATE = WHATSAPP_NUMBER_RATE /
+# WHATSAPP_SEND_PROCESSES per second, with bursts of WHATSAPP_SEND_BURST. Setting WHATSAPP_SEND_RATE
+# directly overrides the split; keep it at or below that formula.
+GRAPH_API_BASE_URL = os.getenv("GRAPH_API_BASE_URL", "https://graph.facebook.com/v19.0")
+WHATSAPP_NUMBER_RATE = float(os.getenv("WHATSAPP_NUMBER_RATE", 80))
+WHATSAPP_SEND_PROCESSES = max(1, int(os.getenv("WHATSAPP_SEND_PROCESSES", int(os.getenv("WEB_CONCURRENCY", 1)) + 1)))
+WHATSAPP_SEND_RATE = float(os.getenv("WHATSAPP_SEND_RATE", WHATSAPP_NUMBER_RATE / WHATSAPP_SEND_PROCESSES))
+WHATSAPP_SEND_BURST = int(os.getenv("WHATSAPP_SEND_BURST", max(1, int(WHATSAPP_SEND_RATE))))
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", 3))
+GRAPH_BACKOFF_BASE = float(os.getenv("GRAPH_BACKOFF_BASE", 0.5))
+GRAPH_BACKOFF_MAX = float(os.getenv("GRAPH_BACKOFF_MAX", 30))
+GRAPH_TIMEOUT = float(os.getenv("GRAPH_TIMEOUT", 30))
+GRAPH_POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", 16))
+
 # --- DATABASE CONFIGURATION ---
 # Hierarchy Database
 DB_HIERARCHY_CONFIG = {
@@ -32,4 +52,107 @@ DB_ATTENDANCE_CONFIG = {
     'db': os.getenv("DB_ATTENDANCE_DB"),
     'charset': 'utf8mb4',
     'cursorclass': pymysql.cursors.DictCursor
-}
\ No newline at end of file
+}
+
+# --- DATABASE CONNECTION POOLS ---
+# One pool per database config above; timeouts are in seconds.
+def _pool_settings(prefix, min_size, max_size):
+    return {
+        "min_size": int(os.getenv(f"{prefix}_POOL_MIN_SIZE", min_size)),
+        "max_size": int(os.getenv(f"{prefix}_POOL_MAX_SIZE", max_size)),
+        "wait_timeout": float(os.getenv(f"{prefix}_POOL_WAIT_TIMEOUT", 10)),
+        "idle_timeout": float(os.getenv(f"{prefix}_POOL_IDLE_TIMEOUT", 300)),
+        "max_lifetime": float(os.getenv(f"{prefix}_POOL_MAX_LIFETIME", 3600)),
+        "ping_interval": float(os.getenv(f"{prefix}_POOL_PING_INTERVAL", 30)),
+    }
+
+
+DB_HIERARCHY_POOL_CONFIG = _pool_settings("DB_HIERARCHY", 1, 5)
+DB_ATTENDANCE_POOL_CONFIG = _pool_settings("DB_ATTENDANCE", 1, 10)
+
+
+# --- HIERARCHY SNAPSHOT ---
+# The in-memory copy of the user table is re-checked every poll interval and fully reloaded
+# when its change marker moves or it is older than the max age (seconds).
+HIERARCHY_POLL_INTERVAL = float(os.getenv("HIERARCHY_POLL_INTERVAL", 30))
+HIERARCHY_MAX_AGE = float(os.getenv("HIERARCHY_MAX_AGE", 600))
+
+# --- ATTENDANCE CACHE ---
+# How long (seconds) today's attendance results are reused before re-querying V_NFL_BA_ATTENDANCE.
+ATTENDANCE_CACHE_TTL = float(os.getenv("ATTENDANCE_CACHE_TTL", 60))
+ATTENDANCE_CACHE_MAX_ENTRIES = int(os.getenv("ATTENDANCE_CACHE_MAX_ENTRIES", 512))
+
+# --- MESSAGE WORKERS ---
+# WORKER_QUEUE_POLICY is "reject" (answer 503 so Meta redelivers) or "block" (wait up to
+# WORKER_BLOCK_TIMEOUT seconds for queue space, then reject).
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", 8))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", 200))
+WORKER_QUEUE_POLICY = os.getenv("WORKER_QUEUE_POLICY", "reject")
+WORKER_BLOCK_TIMEOUT = float(os.getenv("WORKER_BLOCK_TIMEOUT", 2))
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", 20))
+
+# --- CHART RENDERING ---
+# Output is CHART_SIZE x CHART_SIZE pixels; compression is the PNG zlib level (0-9) and
+# CHART_PALETTE_COLORS > 0 stores the chart as an indexed PNG with that many colours.
+CHART_SIZE = int(os.getenv("CHART_SIZE", 800))
+CHART_PNG_COMPRESSION = int(os.getenv("CHART_PNG_COMPRESSION", 6))
+CHART_PALETTE_COLORS = int(os.getenv("CHART_PALETTE_COLORS", 64))
+
+# --- CHART CACHE ---
+# Uploaded WhatsApp media stays valid for 30 days; cached media IDs must expire well before that.
+CHART_CACHE_MAX_ENTRIES = int(os.getenv("CHART_CACHE_MAX_ENTRIES", 256))
+CHART_PNG_TTL = float(os.getenv("CHART_PNG_TTL", 86400))
+CHART_MEDIA_TTL = float(os.getenv("CHART_MEDIA_TTL", 7 * 86400))
+
+# --- MESSAGE DEDUPLICATION ---
+# "sqlite" shares processed message ids between all worker processes on a host; "memory" is per process.
+DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", "sqlite")
+DEDUP_SQLITE_PATH = os.getenv("DEDUP_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "whatsapp_ai_dedup.sqlite3"))
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", 86400))
+
+# --- REPORT SNAPSHOT ---
+# The day's report tree is rebuilt every REPORT_REFRESH_INTERVAL seconds; a snapshot older than
+# REPORT_MAX_AGE is ignored and reports fall back to querying the databases directly.
+REPORT_MATERIALIZER_ENABLED = os.getenv("REPORT_MATERIALIZER_ENABLED", "true").lower() in ("1", "true", "yes")
+REPORT_REFRESH_INTERVAL = float(os.getenv("REPORT_REFRESH_INTERVAL", 60))
+REPORT_MAX_AGE = float(os.getenv("REPORT_MAX_AGE", 300))
+
+# --- CONVERSATION CACHE ---
+# What each list row / button sent to a phone refers to, kept long enough to answer the follow-up tap.
+CONVERSATION_CACHE_TTL = float(os.getenv("CONVERSATION_CACHE_TTL", 300))
+CONVERSATION_CACHE_MAX_ENTRIES = int(os.getenv("CONVERSATION_CACHE_MAX_ENTRIES", 4096))
+
+# --- ATTENDANCE TRENDS ---
+# Completed days' per-supervisor counts are copied once into a local SQLite rollup; TREND_HISTORY_DAYS
+# must cover the 30-day window plus the previous 30 days it is compared against.
+TREND_STORE_PATH = os.getenv("TREND_STORE_PATH", os.path.join(tempfile.gettempdir(), "whatsapp_ai_trends.sqlite3"))
+TREND_HISTORY_DAYS = int(os.getenv("TREND_HISTORY_DAYS", 60))
+
+# --- SCHEDULED BROADCAST (broadcast.py) ---
+# Reports are pushed by BROADCAST_CONCURRENCY threads (the Graph API client still holds them to this
+# process's WHATSAPP_SEND_RATE); failed sends are retried in up to BROADCAST_MAX_ATTEMPTS rounds. Phones stored
+# without a country code get BROADCAST_COUNTRY_CODE prepended.
+BROADCAST_ROLES = os.getenv("BROADCAST_ROLES", "Supervisor,PM,Executive")
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 8))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", 3))
+BROADCAST_RETRY_DELAY = float(os.getenv("BROADCAST_RETRY_DELAY", 30))
+BROADCAST_COUNTRY_CODE = os.getenv("BROADCAST_COUNTRY_CODE", "91")
+BROADCAST_PROGRESS_PATH = os.getenv("BROADCAST_PROGRESS_PATH",
+                                    os.path.join(tempfile.gettempdir(), "whatsapp_ai_broadcast.sqlite3"))
+
+# --- STARTUP WARM-UP ---
+# WARM_UP_ENABLED primes each worker before it takes traffic: chart fonts and the plotting stack, the
+# DB pools, the hierarchy snapshot and today's report (gunicorn.conf.py runs it after each fork).
+# WARM_UP_PRELOAD loads the app once in the gunicorn master (preload_app), so workers fork with the
+# imports, fonts and hierarchy snapshot already in memory. Warm-up counts against gunicorn's --timeout.
+# asgi_app.py always loads the hierarchy at startup; WARM_UP_ENABLED adds the chart priming there.
+WARM_UP_ENABLED = os.getenv("WARM_UP_ENABLED", "false").lower() in ("1", "true", "yes")
+WARM_UP_PRELOAD = os.getenv("WARM_UP_PRELOAD", "false").lower() in ("1", "true", "yes")
+
+# --- ASYNC SERVING MODE (asgi_app.py) ---
+# Webhook batches processed at once on the event loop; beyond ASYNC_MAX_PENDING_CONVERSATIONS queued
+# batches the webhook answers 503 so Meta redelivers. Charts render on ASYNC_CHART_THREADS threads.
+ASYNC_MAX_ACTIVE_CONVERSATIONS = int(os.getenv("ASYNC_MAX_ACTIVE_CONVERSATIONS", 500))
+ASYNC_MAX_PENDING_CONVERSATIONS = int(os.getenv("ASYNC_MAX_PENDING_CONVERSATIONS", 5000))
+ASYNC_CHART_THREADS = int(os.getenv("ASYNC_CHART_THREADS", 4))
+ASYNC_GRAPH_POOL_SIZE = int(os.getenv("ASYNC_GRAPH_POOL_SIZE", 100))
\ No newline at end of file
@@ -0,0 +1,235 @@
+# db_pool.py
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pymysql
+
+from config import (DB_ATTENDANCE_CONFIG, DB_ATTENDANCE_POOL_CONFIG, DB_HIERARCHY_CONFIG,
+                    DB_HIERARCHY_POOL_CONFIG)
+
+
+class PoolTimeoutError(pymysql.err.OperationalError):
+    pass
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+# --- CONNECTION POOL ---
+class ConnectionPool:
+    def __init__(self, config, name, min_size=1, max_size=10, wait_timeout=10.0, idle_timeout=300.0,
+                 max_lifetime=3600.0, ping_interval=30.0, connect_factory=None):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool sizes for {name}: min={min_size} max={max_size}")
+        # Pooled connections must not sit inside an open REPEATABLE READ snapshot between checkouts.
+        self._config = dict(config, autocommit=True)
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self._connect_factory = connect_factory or (lambda: pymysql.connect(**self._config))
+        self._idle = deque()
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {"checkouts": 0, "waits": 0, "wait_time_total": 0.0, "wait_time_max": 0.0, "timeouts": 0,
+                       "created": 0, "recycled": 0, "broken": 0}
+
+    @contextmanager
+    def connection(self):
+        entry = self._checkout()
+        try:
+            yield entry.conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            self._discard(entry, "broken")
+            raise
+        except BaseException:
+            self._checkin(entry)
+            raise
+        else:
+            self._checkin(entry)
+
+    def fill(self):
+        # Open connections up to min_size, e.g. during warm-up before serving traffic.
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                entry = self._open()
+            except BaseException:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            self._checkin(entry)
+
+    def close_idle(self):
+        # Closes the idle connections but keeps the pool usable, e.g. so forked workers do not share sockets.
+        with self._cond:
+            stale = list(self._idle)
+            self._idle.clear()
+            self._size -= len(stale)
+            self._cond.notify_all()
+        for entry in stale:
+            self._close_quietly(entry)
+
+    def reconfigure(self, connect_factory):
+        with self._cond:
+            self._connect_factory = connect_factory
+            stale = list(self._idle)
+            self._idle.clear()
+            self._size -= len(stale)
+            self._cond.notify_all()
+        for entry in stale:
+            self._close_quietly(entry)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            stale = list(self._idle)
+            self._idle.clear()
+            self._size -= len(stale)
+            self._cond.notify_all()
+        for entry in stale:
+            self._close_quietly(entry)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(size=self._size, idle=len(self._idle), in_use=self._size - len(self._idle),
+                         min_size=self.min_size, max_size=self.max_size)
+        stats["wait_time_avg"] = stats["wait_time_total"] / stats["waits"] if stats["waits"] else 0.0
+        return stats
+
+    # --- INTERNALS ---
+    def _checkout(self):
+        started = time.monotonic()
+        deadline = started + self.wait_timeout
+        waited = False
+        while True:
+            entry = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise pymysql.err.InterfaceError(f"Connection pool '{self.name}' is closed")
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.wait_timeout:.1f}s waiting for a '{self.name}' connection")
+                    waited = True
+                    self._cond.wait(remaining)
+            if entry is None:
+                try:
+                    entry = self._open()
+                except BaseException:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            else:
+                reason = self._unusable_reason(entry)
+                if reason:
+                    self._discard(entry, reason)
+                    continue
+            self._record_checkout(time.monotonic() - started, waited)
+            return entry
+
+    def _checkin(self, entry):
+        now = time.monotonic()
+        entry.last_used = now
+        if self.max_lifetime and now - entry.created_at > self.max_lifetime:
+            self._discard(entry, "recycled")
+            return
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                closing = True
+            else:
+                self._idle.append(entry)
+                closing = False
+            self._cond.notify()
+        if closing:
+            self._close_quietly(entry)
+        else:
+            self._prune_idle()
+
+    def _unusable_reason(self, entry):
+        now = time.monotonic()
+        if self.max_lifetime and now - entry.created_at > self.max_lifetime:
+            return "recycled"
+        if self.idle_timeout and now - entry.last_used > self.idle_timeout:
+            return "recycled"
+        if now - entry.last_used >= self.ping_interval:
+            try:
+                entry.conn.ping(reconnect=False)
+            except Exception:
+                return "broken"
+        return None
+
+    def _prune_idle(self):
+        # Idle connections are kept LIFO, so the stalest ones sit at the left end.
+        if not self.idle_timeout:
+            return
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._cond:
+            while len(self._idle) and self._size > self.min_size and self._idle[0].last_used < cutoff:
+                expired.append(self._idle.popleft())
+                self._size -= 1
+            self._stats["recycled"] += len(expired)
+        for entry in expired:
+            self._close_quietly(entry)
+
+    def _open(self):
+        entry = _PooledConnection(self._connect_factory())
+        with self._cond:
+            self._stats["created"] += 1
+        return entry
+
+    def _discard(self, entry, reason):
+        with self._cond:
+            self._size -= 1
+            self._stats[reason] += 1
+            self._cond.notify()
+        self._close_quietly(entry)
+
+    def _record_checkout(self, wait_time, waited):
+        with self._cond:
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_time_total"] += wait_time
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait_time)
+
+    @staticmethod
+    def _close_quietly(entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+
+# --- SHARED POOLS ---
+hierarchy_pool = ConnectionPool(DB_HIERARCHY_CONFIG, "hierarchy", **DB_HIERARCHY_POOL_CONFIG)
+attendance_pool = ConnectionPool(DB_ATTENDANCE_CONFIG, "attendance", **DB_ATTENDANCE_POOL_CONFIG)
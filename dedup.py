@@ -0,0 +1,118 @@
+# dedup.py
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+
+# --- IN-MEMORY BACKEND ---
+# O(1) membership via a dict; a ring of (expires_at, id) in insertion order lets expired ids be
+# dropped from the front without scanning. Only deduplicates within one process.
+class MemoryDedupStore:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._expires = {}
+        self._ring = deque()
+        self._lock = threading.Lock()
+
+    def add_if_new(self, message_id):
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            if message_id in self._expires:
+                return False
+            expires_at = now + self.ttl
+            self._expires[message_id] = expires_at
+            self._ring.append((expires_at, message_id))
+            return True
+
+    def forget(self, message_id):
+        with self._lock:
+            self._expires.pop(message_id, None)
+
+    def __len__(self):
+        return len(self._expires)
+
+    def _purge(self, now):
+        ring = self._ring
+        while ring and ring[0][0] <= now:
+            expires_at, message_id = ring.popleft()
+            # The id may have been forgotten and re-added since; only drop the matching entry.
+            if self._expires.get(message_id) == expires_at:
+                del self._expires[message_id]
+
+
+# --- SQLITE BACKEND ---
+# A WAL-mode SQLite file shared by every process on the host (e.g. all gunicorn workers).
+# INSERT OR IGNORE on the primary key makes "first delivery wins" atomic across processes.
+class SQLiteDedupStore:
+    def __init__(self, path, ttl, purge_interval=60.0):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._last_purge = 0.0
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS processed_messages "
+                         "(message_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS processed_messages_expiry ON processed_messages (expires_at)")
+        finally:
+            conn.close()
+
+    def add_if_new(self, message_id):
+        now = time.time()
+        try:
+            conn = self._connection()
+            self._maybe_purge(conn, now)
+            conn.execute("DELETE FROM processed_messages WHERE message_id = ? AND expires_at <= ?", (message_id, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO processed_messages (message_id, expires_at) VALUES (?, ?)",
+                                  (message_id, now + self.ttl))
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            # Fail open: a rare double reply beats silently dropping a message.
+            print(f"[DEDUP] SQLite error, treating message as new: {e}")
+            return True
+
+    def forget(self, message_id):
+        try:
+            self._connection().execute("DELETE FROM processed_messages WHERE message_id = ?", (message_id,))
+        except sqlite3.Error as e:
+            print(f"[DEDUP] SQLite error while forgetting {message_id}: {e}")
+
+    def __len__(self):
+        row = self._connection().execute("SELECT COUNT(*) FROM processed_messages WHERE expires_at > ?",
+                                         (time.time(),)).fetchone()
+        return row[0]
+
+    def _maybe_purge(self, conn, now):
+        if now - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = now
+        conn.execute("DELETE FROM processed_messages WHERE expires_at <= ?", (now,))
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads, so keep one per thread (and per process).
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+
+def create_dedup_store(backend, ttl, sqlite_path):
+    if backend == "sqlite":
+        try:
+            return SQLiteDedupStore(sqlite_path, ttl)
+        except sqlite3.Error as e:
+            print(f"[DEDUP] Could not open {sqlite_path} ({e}); falling back to per-process memory store")
+    elif backend != "memory":
+        raise ValueError(f"Unknown dedup backend: {backend}")
+    return MemoryDedupStore(ttl)
@@ -0,0 +1,259 @@
+# flows.py
+# The conversation flows, shared by main.py (worker threads) and asgi_app.py (asyncio). A flow is a
+# generator: it yields each operation it needs as an (operation, *args) tuple and gets the result sent
+# back in, so the branching lives here and each app's run_flow only performs the operations.
+#   queries: user_by_id, subordinates, supervisor_team_leads, company_rollup, org_node, attendance, trend
+#   replies (to the sender): recall, remember, chart_report, trend_report, text, list, buttons
+from attendance import describe_attendance
+from report_messages import (INVALID_SELECTION, MENU_EXPIRED, NEXT_PAGE_PREFIX, NO_COMPANY_DATA, NO_SUPERVISORS,
+                             NO_TREND_DATA, SUPERVISOR_NOT_FOUND, ba_list_buttons, ba_list_lines,
+                             company_summary_lines, executive_menu_rows, list_page, org_report_lines, org_rows,
+                             supervisor_report_text, supervisor_rows, supervisor_trend_button, team_report_lines,
+                             team_trend_rows, trend_report_lines)
+from trends import team_lead_groups
+
+BA_LIST_PREFIXES = ("view_present-", "view_absent-")
+DRILL_DOWN_PREFIXES = ("view_org-", "view_team-", "view_sup-") + BA_LIST_PREFIXES
+
+
+def user_fields(user, fields=('user_id', 'name', 'role')):
+    return {field: user.get(field) for field in fields} if user else None
+
+
+# --- ENTRY POINT ---
+def message_flow(role_flow, user, selected_id):
+    # One incoming message: a "Next page" row replays the stored menu, anything else goes to the role's flow.
+    if selected_id.startswith(NEXT_PAGE_PREFIX):
+        yield from list_page_flow(selected_id)
+    else:
+        yield from role_flow(user, selected_id)
+
+
+# --- ROLE FLOWS ---
+def executive_flow(user, selected_id):
+    if selected_id == 'exec_view_report':
+        yield from company_report()
+    elif selected_id == 'exec_view_trends' or selected_id.startswith("trend_"):
+        yield from trend_report(selected_id)
+    elif selected_id.startswith(DRILL_DOWN_PREFIXES):
+        yield from drill_down(selected_id)
+    else:
+        yield from menu(f"Welcome, {user['name']}", "Please select an option to get started.", "Main Menu",
+                        [{"title": "Options", "rows": executive_menu_rows()}])
+
+
+def pm_flow(user, selected_id):
+    # Team leads, and zonal/regional layers above them, get the report for their own level of the org.
+    if selected_id.startswith(("trend_team-", "trend_sup-")):
+        yield from trend_report(selected_id)
+    elif selected_id.startswith(DRILL_DOWN_PREFIXES):
+        yield from drill_down(selected_id)
+    else:
+        node = yield ('org_node', user['user_id'])
+        if node and node['managers']:
+            yield from org_report(node)
+        else:
+            yield from team_report(user)
+
+
+def supervisor_flow(user, selected_id):
+    if selected_id.startswith(BA_LIST_PREFIXES):
+        yield from ba_list(selected_id)
+    elif selected_id.startswith("trend_sup-"):
+        yield from trend_report(selected_id)
+    else:
+        yield from supervisor_report(user)
+
+
+ROLE_FLOWS = {
+    'Supervisor': supervisor_flow,
+    'PM': pm_flow,
+    'Executive': executive_flow,
+}
+
+
+# --- REPORTS ---
+def company_report():
+    rollup = yield ('company_rollup',)
+    if not rollup:
+        yield ('text', NO_COMPANY_DATA)
+        return
+    team_leads = rollup['team_leads']
+    yield ('chart_report', {'Present': rollup['present'], 'Absent': rollup['absent']}, "NFL Attendance Report",
+           company_summary_lines(team_leads))
+    # The "Unassigned" group (supervisors without a manager) is in the summary but has no report of its own.
+    team_leads = [lead for lead in team_leads if lead['user_id'] is not None]
+    for lead in team_leads:
+        if lead.get('team_lead', True):
+            supervisors = [{'user_id': s['user_id'], 'name': s['name'], 'role': 'Supervisor'}
+                           for s in lead['supervisors']]
+            yield ('remember', f"view_team-{lead['user_id']}", {'user': user_fields(lead), 'supervisors': supervisors})
+    if not team_leads:
+        return
+    yield from menu("Drill Down", "Select a team lead to view their report.", "View Teams",
+                    [{"title": "Team Leads", "rows": org_rows(team_leads)}])
+
+
+def team_report(user, supervisors=None):
+    if supervisors is None:
+        supervisors = yield ('subordinates', user['user_id'], 'Supervisor')
+    if not supervisors:
+        yield ('text', NO_SUPERVISORS)
+        return
+    summary_text, team_stats, supervisor_stats = yield ('attendance', [s['name'] for s in supervisors])
+    chart_data = {'Present': team_stats.get('present', 0), 'Absent': team_stats.get('absent', 0)}
+    yield ('chart_report', chart_data, f"Team Attendance for {user['name']}",
+           team_report_lines(user['name'], summary_text, supervisors, supervisor_stats))
+    for sup in supervisors:
+        if sup['name'] in supervisor_stats:
+            yield ('remember', f"view_sup-{sup['user_id']}", {'user': sup, 'stats': supervisor_stats[sup['name']]})
+    yield from menu("Drill Down", "Select a supervisor to view their report.", "View Supervisors",
+                    [{"title": "Supervisors", "rows": supervisor_rows(supervisors)},
+                     {"title": "Trends", "rows": team_trend_rows(user['user_id'])}])
+
+
+def org_report(node):
+    # A manager with other managers below them: their rollup, then a menu one level down.
+    summary_text = describe_attendance(node['present'], node['absent'])
+    yield ('chart_report', {'Present': node['present'], 'Absent': node['absent']}, f"Attendance for {node['name']}",
+           org_report_lines(node, summary_text))
+    sections = [{"title": "Managers", "rows": org_rows(node['managers'])}]
+    if node['supervisors']:
+        sections.append({"title": "Supervisors", "rows": supervisor_rows(node['supervisors'])})
+    yield from menu("Drill Down", "Select a manager or supervisor to view their report.", "View Reports", sections)
+
+
+def supervisor_report(user, stats=None):
+    supervisor_id, supervisor_name = user['user_id'], user['name']
+    if stats is None:
+        summary_text, stats, _ = yield ('attendance', [supervisor_name])
+    else:
+        summary_text = describe_attendance(stats['present'], stats['absent'])
+    chart_data = {'Present': stats.get('present', 0), 'Absent': stats.get('absent', 0)}
+    yield ('chart_report', chart_data, f"Attendance for {supervisor_name}",
+           supervisor_report_text(supervisor_name, summary_text))
+    buttons = ba_list_buttons(supervisor_id, stats)
+    for button in buttons:
+        names_key = 'present_names' if button['id'].startswith("view_present-") else 'absent_names'
+        yield ('remember', button['id'], {'supervisor': supervisor_name, 'names': stats[names_key]})
+    yield ('buttons', "Select an option to view names or trends.", buttons + [supervisor_trend_button(supervisor_id)])
+
+
+def trend_report(selected_id):
+    # exec_view_trends (company, by team lead), trend_team-<PM id> (by supervisor) or trend_sup-<id>.
+    if selected_id == 'exec_view_trends':
+        supervisors = yield ('supervisor_team_leads',)
+        name, names = "NFL", [s['name'] for s in supervisors]
+        groups, breakdown_title = team_lead_groups(supervisors), "By Team Lead"
+    else:
+        kind, user = selected_id.split('-', 1)[0], None
+        user_id = _option_user_id(selected_id)
+        if user_id is not None:
+            user = yield ('user_by_id', user_id)
+        if not user:
+            yield ('text', INVALID_SELECTION)
+            return
+        name = user['name']
+        if kind == 'trend_team':
+            names = [s['name'] for s in (yield ('subordinates', user['user_id'], 'Supervisor'))]
+            groups, breakdown_title = {n: [n] for n in names}, "By Supervisor"
+        else:
+            names, groups, breakdown_title = [name], None, None
+    trend = yield ('trend', names, groups)
+    if not trend['points']:
+        yield ('text', NO_TREND_DATA)
+        return
+    yield ('trend_report', trend['points'], f"Daily Attendance for {name}",
+           trend_report_lines(name, trend, breakdown_title))
+
+
+# --- DRILL-DOWN ---
+def drill_down(selected_id):
+    # Rows and buttons offered under a report; the data behind most of them was remembered when it was sent.
+    if selected_id.startswith("view_org-"):
+        yield from view_org(selected_id)
+    elif selected_id.startswith("view_team-"):
+        yield from view_team(selected_id)
+    elif selected_id.startswith("view_sup-"):
+        yield from view_supervisor(selected_id)
+    else:
+        yield from ba_list(selected_id)
+
+
+def view_org(selected_id):
+    user_id = _option_user_id(selected_id)
+    node = (yield ('org_node', user_id)) if user_id is not None else None
+    if not node:
+        yield ('text', INVALID_SELECTION)
+    elif node['managers']:
+        yield from org_report(node)
+    else:
+        yield from team_report(user_fields(node), [user_fields(s) for s in node['supervisors']])
+
+
+def view_team(selected_id):
+    selection = yield ('recall', selected_id)
+    if selection:
+        yield from team_report(selection['user'], selection['supervisors'])
+        return
+    user_id = _option_user_id(selected_id)
+    pm_details = (yield ('user_by_id', user_id)) if user_id is not None else None
+    if pm_details:
+        yield from team_report(pm_details)
+
+
+def view_supervisor(selected_id):
+    selection = yield ('recall', selected_id)
+    if selection:
+        yield from supervisor_report(selection['user'], selection['stats'])
+        return
+    user_id = _option_user_id(selected_id)
+    supervisor_details = (yield ('user_by_id', user_id)) if user_id is not None else None
+    if supervisor_details:
+        yield from supervisor_report(supervisor_details)
+
+
+def ba_list(selected_id):
+    action = selected_id.split('-', 1)[0]
+    supervisor_id = _option_user_id(selected_id)
+    if supervisor_id is None:
+        yield ('text', INVALID_SELECTION)
+        return
+    selection = yield ('recall', selected_id)
+    if selection:
+        supervisor_name, names = selection['supervisor'], selection['names']
+    else:
+        supervisor_details = yield ('user_by_id', supervisor_id)
+        if not supervisor_details:
+            yield ('text', SUPERVISOR_NOT_FOUND)
+            return
+        supervisor_name = supervisor_details['name']
+        _, stats, _ = yield ('attendance', [supervisor_name])
+        names = stats.get('present_names' if action == "view_present" else 'absent_names', [])
+    yield ('text', ba_list_lines(action, supervisor_name, names))
+
+
+def _option_user_id(selected_id):
+    # "<kind>-<user id>" -> the id, or None when the option was not one we sent.
+    try:
+        return int(selected_id.split('-', 1)[1])
+    except (ValueError, IndexError):
+        return None
+
+
+# --- MENUS ---
+def menu(header, body, button, sections, page=0):
+    # A list message; a long menu goes out a page at a time and the rest is kept for its "Next page" row.
+    page_sections, next_page_id = list_page(sections, page)
+    if next_page_id:
+        yield ('remember', next_page_id, {'header': header, 'body': body, 'button': button, 'sections': sections,
+                                          'page': page + 1})
+    yield ('list', header, body, button, page_sections)
+
+
+def list_page_flow(selected_id):
+    stored = yield ('recall', selected_id)
+    if not stored:
+        yield ('text', MENU_EXPIRED)
+        return
+    yield from menu(stored['header'], stored['body'], stored['button'], stored['sections'], stored['page'])
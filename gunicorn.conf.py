@@ -0,0 +1,20 @@
+# gunicorn.conf.py
+# Read by gunicorn when it is started from this directory, e.g. `gunicorn main:app`.
+# Both hooks are no-ops unless WARM_UP_PRELOAD / WARM_UP_ENABLED are set (see config.py).
+from config import WARM_UP_ENABLED, WARM_UP_PRELOAD
+
+preload_app = WARM_UP_PRELOAD
+
+
+def when_ready(server):
+    # Master, after the preloaded app is imported and before any worker is forked.
+    if WARM_UP_PRELOAD:
+        import main
+        main.warm_up(preload=True)
+
+
+def post_fork(server, worker):
+    # Each worker, before it accepts its first request.
+    if WARM_UP_ENABLED:
+        import main
+        main.warm_up()
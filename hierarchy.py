@@ -0,0 +1,269 @@
+# hierarchy.py
+import os
+import re
+import threading
+import time
+
+import pymysql
+
+from config import HIERARCHY_MAX_AGE, HIERARCHY_POLL_INTERVAL
+from db_pool import hierarchy_pool
+from metrics import db_query_seconds
+
+_NON_DIGITS = re.compile(r'\D')
+
+USERS_QUERY = "SELECT user_id, name, role, phone, manager_id FROM user"
+CHANGE_MARKER_QUERY = "SELECT COUNT(*) AS user_count, MAX(user_id) AS max_user_id FROM user"
+UPDATE_TIME_QUERY = "SELECT UPDATE_TIME AS updated_at FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'user'"
+
+
+def normalize_phone(phone):
+    # Same matching rule as RIGHT(REPLACE(phone, '-', ''), 10), tolerant of spaces, '+' and brackets too.
+    return _NON_DIGITS.sub('', str(phone or ''))[-10:]
+
+
+# --- SNAPSHOT ---
+class HierarchySnapshot:
+    def __init__(self, users):
+        self.loaded_at = time.monotonic()
+        self.by_id = {}
+        self.by_phone = {}
+        self.by_manager_role = {}
+        self.by_role = {}
+        for user in sorted(users, key=lambda u: u['user_id']):
+            self.by_id[user['user_id']] = user
+            phone_key = normalize_phone(user.get('phone'))
+            if phone_key:
+                self.by_phone.setdefault(phone_key, user)
+            self.by_manager_role.setdefault((user.get('manager_id'), user.get('role')), []).append(user)
+            self.by_role.setdefault(user.get('role'), []).append(user)
+        self._build_closure()
+
+    def supervisor_team_leads(self):
+        # Same rows as attendance.fetch_supervisor_team_leads(), without the self-join.
+        rows = []
+        for sup in self.by_role.get('Supervisor', []):
+            lead = self.by_id.get(sup.get('manager_id'))
+            rows.append({'user_id': sup['user_id'], 'name': sup['name'],
+                         'lead_id': lead['user_id'] if lead else None, 'lead_name': lead['name'] if lead else None,
+                         'lead_role': lead['role'] if lead else None})
+        return rows
+
+    # --- CLOSURE ---
+    # The manager_id tree flattened once per snapshot: a pre-order walk gives every node a contiguous
+    # span, so a subtree (all descendants) is one slice and ancestors are stored per node.
+    def subtree(self, user_id):
+        span = self._spans.get(user_id)
+        return self._preorder[span[0] + 1:span[1]] if span else []
+
+    def ancestors(self, user_id):
+        # Manager ids from the top of the tree down to the direct manager.
+        return self._ancestor_ids.get(user_id, ())
+
+    def direct_reports(self, user_id):
+        return self._children.get(user_id, [])
+
+    def supervisors_under(self, user_id):
+        return [user for user in self.subtree(user_id) if user.get('role') == 'Supervisor']
+
+    def manager_reports(self, user_id):
+        # Direct reports that manage supervisors themselves (an empty list means user_id is a team lead).
+        return [user for user in self._children.get(user_id, [])
+                if user.get('role') != 'Supervisor' and user['user_id'] in self._has_supervisors]
+
+    def top_managers(self):
+        # The highest non-executive managers with supervisors below them, however many layers the org has.
+        return self._top_managers
+
+    def ungrouped_supervisors(self):
+        # Supervisors below none of the top managers (reporting straight to an Executive, or with no manager
+        # in the table): {nearest non-supervisor manager id, or None: [supervisors]}.
+        grouped = {s['user_id'] for top in self._top_managers for s in self.supervisors_under(top['user_id'])}
+        groups = {}
+        for sup in self.by_role.get('Supervisor', []):
+            if sup['user_id'] in grouped:
+                continue
+            manager_id = next((i for i in reversed(self.ancestors(sup['user_id']))
+                               if self.by_id[i].get('role') != 'Supervisor'), None)
+            groups.setdefault(manager_id, []).append(sup)
+        return groups
+
+    def rollup(self, counts):
+        # counts: {supervisor name: {'present': n, 'absent': m}} -> the same totals for every node, in one
+        # bottom-up pass (reverse pre-order visits every child before its manager).
+        totals = {}
+        for user in reversed(self._preorder):
+            node = totals.setdefault(user['user_id'], {'present': 0, 'absent': 0})
+            if user.get('role') == 'Supervisor':
+                sup_counts = counts.get(user['name'], {})
+                node['present'] += sup_counts.get('present', 0)
+                node['absent'] += sup_counts.get('absent', 0)
+            parent_id = self._parent_ids.get(user['user_id'])
+            if parent_id is not None:
+                parent = totals.setdefault(parent_id, {'present': 0, 'absent': 0})
+                parent['present'] += node['present']
+                parent['absent'] += node['absent']
+        return totals
+
+    def _build_closure(self):
+        self._children = {}
+        self._parent_ids = {}
+        for user in self.by_id.values():
+            manager_id = user.get('manager_id')
+            if manager_id in self.by_id and manager_id != user['user_id']:
+                self._children.setdefault(manager_id, []).append(user)
+                self._parent_ids[user['user_id']] = manager_id
+        self._preorder = []
+        self._spans = {}
+        self._ancestor_ids = {}
+        for user in self.by_id.values():
+            if user['user_id'] not in self._parent_ids:
+                self._walk(user)
+        # Whatever is left hangs off a manager_id cycle. Each cycle is broken above its lowest user id, which
+        # becomes a root: that edge is dropped from both maps, so the old manager no longer lists them.
+        for user_id in sorted(self.by_id):
+            if user_id in self._spans:
+                continue
+            steps = {}
+            while user_id not in steps:
+                steps[user_id] = len(steps)
+                user_id = self._parent_ids[user_id]
+            root_id = min(i for i, step in steps.items() if step >= steps[user_id])
+            manager_id = self._parent_ids.pop(root_id)
+            self._children[manager_id] = [u for u in self._children[manager_id] if u['user_id'] != root_id]
+            self._walk(self.by_id[root_id])
+        self._has_supervisors = has_supervisors = set()
+        for user in reversed(self._preorder):
+            parent_id = self._parent_ids.get(user['user_id'])
+            if parent_id is not None and (user.get('role') == 'Supervisor' or user['user_id'] in has_supervisors):
+                has_supervisors.add(parent_id)
+        self._top_managers = [self.by_id[i] for i in self._spans if i in has_supervisors
+                              and self.by_id[i].get('role') not in ('Executive', 'Supervisor')
+                              and not any(a in has_supervisors and self.by_id[a].get('role') != 'Executive'
+                                          for a in self._ancestor_ids[i])]
+
+    def _walk(self, root):
+        # Iterative DFS (org charts can be deeper than the recursion limit would like).
+        stack = [(root, (), False)]
+        while stack:
+            user, ancestors, done = stack.pop()
+            user_id = user['user_id']
+            if done:
+                self._spans[user_id] = (self._spans[user_id][0], len(self._preorder))
+                continue
+            if user_id in self._spans:
+                continue
+            self._spans[user_id] = (len(self._preorder), None)
+            self._ancestor_ids[user_id] = ancestors
+            self._preorder.append(user)
+            stack.append((user, ancestors, True))
+            for child in reversed(self._children.get(user_id, [])):
+                if child['user_id'] not in self._spans:
+                    stack.append((child, ancestors + (user_id,), False))
+
+
+# --- INDEX ---
+class HierarchyIndex:
+    def __init__(self, pool, poll_interval=HIERARCHY_POLL_INTERVAL, max_age=HIERARCHY_MAX_AGE):
+        self._pool = pool
+        self.poll_interval = poll_interval
+        self.max_age = max_age
+        self._snapshot = None
+        self._marker = None
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def snapshot(self):
+        # Returns None when the user table could not be loaded; callers fall back to SQL.
+        snapshot = self._snapshot
+        if snapshot is not None and self._pid == os.getpid():
+            return snapshot
+        with self._load_lock:
+            if self._snapshot is None or self._pid != os.getpid():
+                # A snapshot preloaded before the fork is kept while it is fresh; the refresher catches up.
+                inherited = self._snapshot
+                if inherited is None or time.monotonic() - inherited.loaded_at >= self.max_age:
+                    try:
+                        self._reload()
+                    except pymysql.MySQLError as e:
+                        print(f"[HIERARCHY] Initial load failed: {e}")
+                        return None
+                self._pid = os.getpid()
+                self._start_refresher()
+            return self._snapshot
+
+    def preload(self):
+        # Loads the snapshot without starting the refresher thread, e.g. in a gunicorn master before it forks.
+        with self._load_lock:
+            if self._snapshot is None:
+                self._reload()
+            return self._snapshot
+
+    def refresh(self, force=False):
+        with self._load_lock:
+            marker = self._read_change_marker()
+            snapshot = self._snapshot
+            expired = snapshot is None or time.monotonic() - snapshot.loaded_at >= self.max_age
+            if force or expired or marker != self._marker:
+                self._reload(marker)
+                return True
+        return False
+
+    def age(self):
+        snapshot = self._snapshot
+        return None if snapshot is None else time.monotonic() - snapshot.loaded_at
+
+    def stop(self):
+        self._stop.set()
+
+    # --- LOOKUPS ---
+    def get_by_phone(self, phone):
+        return self.snapshot().by_phone.get(normalize_phone(phone))
+
+    def get_by_id(self, user_id):
+        return self.snapshot().by_id.get(user_id)
+
+    def get_subordinates(self, manager_id, role):
+        return self.snapshot().by_manager_role.get((manager_id, role), [])
+
+    # --- INTERNALS ---
+    @db_query_seconds.timed('hierarchy_snapshot')
+    def _reload(self, marker=None):
+        if marker is None:
+            marker = self._read_change_marker()
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(USERS_QUERY)
+            users = cursor.fetchall() or []
+        self._snapshot = HierarchySnapshot(users)
+        self._marker = marker
+        print(f"[HIERARCHY] Loaded {len(users)} users")
+
+    def _read_change_marker(self):
+        with self._pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(CHANGE_MARKER_QUERY)
+            marker = dict(cursor.fetchone() or {})
+            try:
+                cursor.execute(UPDATE_TIME_QUERY)
+                marker.update(cursor.fetchone() or {})
+            except pymysql.MySQLError:
+                pass
+        return tuple(sorted(marker.items()))
+
+    def _start_refresher(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="hierarchy-refresh", daemon=True)
+        self._thread.start()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except pymysql.MySQLError as e:
+                print(f"[HIERARCHY] Refresh failed, serving previous snapshot: {e}")
+
+
+hierarchy_index = HierarchyIndex(hierarchy_pool)
@@ -1,61 +1,136 @@
 # main.py
-import io
+import atexit
+import itertools
+import os
+import sqlite3
 import threading
-from collections import deque
+import time
+import traceback
 from datetime import date
 
-import matplotlib
-import matplotlib.patheffects as path_effects
-import matplotlib.pyplot as plt
 import pymysql
 import requests
-import seaborn as sns
-from flask import Flask, request
+from flask import Flask, Response, request
 
 # Import all configuration variables from config.py
-from config import (ACCESS_TOKEN, DB_ATTENDANCE_CONFIG, DB_HIERARCHY_CONFIG,
-                    PHONE_NUMBER_ID, VERIFY_TOKEN)
+from config import (ACCESS_TOKEN, ATTENDANCE_CACHE_MAX_ENTRIES, ATTENDANCE_CACHE_TTL, CHART_CACHE_MAX_ENTRIES,
+                    CHART_MEDIA_TTL, CHART_PALETTE_COLORS, CHART_PNG_COMPRESSION, CHART_PNG_TTL, CHART_SIZE,
+                    CONVERSATION_CACHE_MAX_ENTRIES, CONVERSATION_CACHE_TTL, DEDUP_BACKEND, DEDUP_SQLITE_PATH, DEDUP_TTL,
+                    GRAPH_API_BASE_URL, GRAPH_BACKOFF_BASE, GRAPH_BACKOFF_MAX, GRAPH_MAX_RETRIES, GRAPH_POOL_SIZE,
+                    GRAPH_TIMEOUT, PHONE_NUMBER_ID, REPORT_MATERIALIZER_ENABLED, REPORT_MAX_AGE,
+                    REPORT_REFRESH_INTERVAL, TREND_HISTORY_DAYS, TREND_STORE_PATH, VERIFY_TOKEN, WARM_UP_ENABLED,
+                    WHATSAPP_SEND_BURST, WHATSAPP_SEND_RATE, WORKER_BLOCK_TIMEOUT, WORKER_QUEUE_POLICY,
+                    WORKER_QUEUE_SIZE, WORKER_SHUTDOWN_TIMEOUT, WORKER_THREADS)
+from attendance import (NO_BAS_TODAY, build_company_rollup, build_org_rollup, fetch_daily_status_counts,
+                        fetch_supervisor_team_leads, fetch_todays_attendance_rows, fetch_todays_status_counts, org_node,
+                        summarize_attendance)
+from cache import TTLCache
+from chart_cache import ChartCache
+from chart_renderer import (DonutChartRenderer, colormap_palette, prime_chart_rendering, render_pie_figure,
+                            render_trend_figure)
+from db_pool import attendance_pool, hierarchy_pool
+from dedup import create_dedup_store
+from flows import ROLE_FLOWS, message_flow, pm_flow, user_fields
+from hierarchy import hierarchy_index
+from metrics import (flow_seconds, messages_total, outbound_errors_total, registry, stage_seconds, stats_samples,
+                     webhook_messages_total)
+from report_messages import (CAPTION_LIMIT, CHART_FAILED, NO_CHART_DATA, NO_ROLE, NOT_REGISTERED, button_payload,
+                             image_payload, list_payload, no_flow_text, pack_messages, text_payload)
+from report_snapshot import ReportMaterializer
+from trends import build_trend, create_trend_store
+from webhook_messages import describe_message, iter_webhook_messages, message_intent, selected_option_id
+from whatsapp_client import GraphApiClient
+from workers import KeyedWorkerPool
 
 # --- APP INITIALIZATION ---
-matplotlib.use('Agg')
 app = Flask(__name__)
 
+# --- GRAPH API CLIENT ---
+graph_client = GraphApiClient(ACCESS_TOKEN, PHONE_NUMBER_ID, GRAPH_API_BASE_URL, send_rate=WHATSAPP_SEND_RATE,
+                              send_burst=WHATSAPP_SEND_BURST, max_retries=GRAPH_MAX_RETRIES,
+                              backoff_base=GRAPH_BACKOFF_BASE, backoff_max=GRAPH_BACKOFF_MAX, timeout=GRAPH_TIMEOUT,
+                              pool_size=GRAPH_POOL_SIZE)
+
+# --- ATTENDANCE CACHE ---
+# Today's attendance results keyed by date, so a new day never serves yesterday's numbers.
+attendance_cache = TTLCache(ATTENDANCE_CACHE_MAX_ENTRIES, ATTENDANCE_CACHE_TTL, name="attendance")
+
+# --- CONVERSATION CACHE ---
+# Keyed by (phone, row/button id): the data behind each option just sent, so drill-down taps skip the DB.
+conversation_cache = TTLCache(CONVERSATION_CACHE_MAX_ENTRIES, CONVERSATION_CACHE_TTL, name="conversation")
+
+# --- CHART RENDERING ---
+# One shared renderer: fonts and donut geometry are prepared once, not per chart.
+chart_renderer = DonutChartRenderer(CHART_SIZE, CHART_PNG_COMPRESSION, CHART_PALETTE_COLORS)
+
+# --- CHART CACHE ---
+# Rendered PNGs and their uploaded media IDs, keyed by the chart's counts and title.
+chart_cache = ChartCache(CHART_CACHE_MAX_ENTRIES, CHART_PNG_TTL, CHART_MEDIA_TTL)
+
+# --- REPORT SNAPSHOT ---
+# The full day's report tree is rebuilt in the background; flows read it instead of querying per request.
+report_materializer = ReportMaterializer(lambda: get_supervisor_team_leads(), REPORT_REFRESH_INTERVAL, REPORT_MAX_AGE,
+                                         lambda: hierarchy_index.snapshot()) if REPORT_MATERIALIZER_ENABLED else None
+
+# --- ATTENDANCE TRENDS ---
+# Local rollup of completed days; each sync only fetches the days it does not have yet.
+trend_store = create_trend_store(TREND_STORE_PATH, TREND_HISTORY_DAYS)
+trend_sync_lock = threading.Lock()
+
 # --- DEDUPLICATION MECHANISM ---
-PROCESSED_MESSAGE_IDS = deque(maxlen=1000)
+# Message ids expire by age; the sqlite backend is shared by every worker process on the host.
+dedup_store = create_dedup_store(DEDUP_BACKEND, DEDUP_TTL, DEDUP_SQLITE_PATH)
+
+# --- MESSAGE WORKER POOL ---
+# Keyed by sender phone so rapid taps from one user are handled in the order they arrived.
+message_workers = KeyedWorkerPool(WORKER_THREADS, WORKER_QUEUE_SIZE, policy=WORKER_QUEUE_POLICY,
+                                  block_timeout=WORKER_BLOCK_TIMEOUT, name="message-worker")
+atexit.register(message_workers.shutdown, timeout=WORKER_SHUTDOWN_TIMEOUT)
 
 
 # --- BACKGROUND WORKER FUNCTION ---
-def process_message_in_background(payload):
+def process_message_in_background(sender_phone, messages):
+    # Handles one sender's messages from a webhook batch in order, with a single user lookup.
     with app.app_context():
         try:
-            value = payload.get("entry", [{}])[0].get("changes", [{}])[0].get("value", {})
-            message_data = value.get("messages", [{}])[0]
-            sender_phone = message_data.get("from")
-
-            if not sender_phone or not message_data:
-                return
-
-            user_details = get_user_details(sender_phone)
+            with stage_seconds.time('user_lookup'):
+                user_details = get_user_details(sender_phone)
             if not user_details:
-                send_text_message(sender_phone, "❌ Your phone number is not registered in the system.")
+                send_text_message(sender_phone, NOT_REGISTERED)
                 return
 
             user_role = user_details.get('role')
             if not user_role:
-                send_text_message(sender_phone, "❌ No role found for your account.")
+                send_text_message(sender_phone, NO_ROLE)
                 return
 
-            if user_role == 'Supervisor':
-                handle_supervisor_flow(sender_phone, user_details, message_data)
-            elif user_role == 'PM':
-                handle_pm_flow(sender_phone, user_details, message_data)
-            elif user_role == 'Executive':
-                handle_executive_flow(sender_phone, user_details, message_data)
-            else:
-                send_text_message(sender_phone, f"Your role ({user_role}) does not have a defined report flow.")
+            role_flow = ROLE_FLOWS.get(user_role)
+            if not role_flow and has_direct_reports(user_details['user_id']):
+                role_flow = pm_flow  # zonal/regional layers get the team-lead flow at their level
+            if not role_flow:
+                send_text_message(sender_phone, no_flow_text(user_role))
+                return
+
+            previous_intent = None
+            for message_data in messages:
+                # Repeated taps of the same option within one batch only need one reply.
+                intent = message_intent(message_data)
+                if intent == previous_intent:
+                    print(f"[COALESCED] Skipping repeated {intent} from {sender_phone[-4:]}")
+                    continue
+                previous_intent = intent
+                started = time.perf_counter()
+                try:
+                    run_flow(sender_phone, message_flow(role_flow, user_details, selected_option_id(message_data)))
+                    messages_total.inc(user_role, 'ok')
+                except Exception as e:
+                    messages_total.inc(user_role, 'error')
+                    print(f"Error handling message {message_data.get('id')}: {e}")
+                    traceback.print_exc()
+                finally:
+                    flow_seconds.observe(time.perf_counter() - started, user_role)
         except Exception as e:
             print(f"Error in background thread: {e}")
-            import traceback
             traceback.print_exc()
 
 
@@ -75,42 +150,33 @@ def webhook():
             data = request.get_json()
             if not data or 'entry' not in data:
                 return "OK", 200
-            value = data.get('entry', [{}])[0].get('changes', [{}])[0].get('value', {})
-            if 'statuses' in value:
-                return "OK", 200
-            messages = value.get('messages', [])
-            if not messages:
-                return "OK", 200
-            message = messages[0]
-            message_id = message.get('id')
-            if not message_id:
-                return "OK", 200
-            sender_phone = message.get('from')
-            if not sender_phone or sender_phone == PHONE_NUMBER_ID:
-                return "OK", 200
-
-            message_type = message.get('type', 'unknown')
-            if message_type == 'text':
-                content = message.get('text', {}).get('body', '')[:50]
-            elif message_type == 'interactive':
-                interactive_data = message.get('interactive', {})
-                if interactive_data.get('type') == 'list_reply':
-                    content = f"List: {interactive_data.get('list_reply', {}).get('title', '')}"
-                elif interactive_data.get('type') == 'button_reply':
-                    content = f"Button: {interactive_data.get('button_reply', {}).get('title', '')}"
+            batches = {}
+            for message in iter_webhook_messages(data):
+                message_id = message.get('id')
+                sender_phone = message.get('from')
+                if not message_id or not sender_phone or sender_phone == PHONE_NUMBER_ID:
+                    continue
+                print(f"[MESSAGE] From: {sender_phone[-4:]} | Type: {message.get('type', 'unknown')} | "
+                      f"Content: {describe_message(message)}")
+                if not dedup_store.add_if_new(message_id):
+                    webhook_messages_total.inc('duplicate')
+                    print(f"[DUPLICATE] Message already processed: {message_id}")
+                    continue
+                batches.setdefault(sender_phone, []).append(message)
+
+            deferred = []
+            for sender_phone, messages in batches.items():
+                if message_workers.submit(sender_phone, process_message_in_background, sender_phone, messages):
+                    webhook_messages_total.inc('accepted', amount=len(messages))
                 else:
-                    content = f"Interactive: {interactive_data.get('type', '')}"
-            else:
-                content = message_type
-            print(f"[MESSAGE] From: {sender_phone[-4:]} | Type: {message_type} | Content: {content}")
-
-            if message_id in PROCESSED_MESSAGE_IDS:
-                print(f"[DUPLICATE] Message already processed: {message_id}")
-                return "OK", 200
-
-            PROCESSED_MESSAGE_IDS.append(message_id)
-            thread = threading.Thread(target=process_message_in_background, args=(data,))
-            thread.start()
+                    deferred.extend(m['id'] for m in messages)
+            if deferred:
+                webhook_messages_total.inc('deferred', amount=len(deferred))
+                # Let Meta redeliver later instead of silently dropping; accepted ids stay deduplicated.
+                for message_id in deferred:
+                    dedup_store.forget(message_id)
+                print(f"[BUSY] Worker queue full, deferring {len(deferred)} message(s)")
+                return "Busy", 503
         except Exception as e:
             print(f"[ERROR] Webhook handler: {e}")
         return "OK", 200
@@ -119,362 +185,355 @@ def webhook():
 
 
 # --- CHART GENERATION FUNCTION ---
+@stage_seconds.timed('chart')
 def create_attendance_pie_chart(data, title):
     if not data or sum(data.values()) == 0:
         return None
+    cache_key = ChartCache.key(data, title, chart_renderer.cache_token)
+    return chart_cache.render(cache_key, lambda: _render_attendance_pie_chart(data, title))
 
+
+def _render_attendance_pie_chart(data, title):
     sorted_data = dict(sorted(data.items()))
-    labels = sorted_data.keys()
-    sizes = list(sorted_data.values())
+    if set(sorted_data) == {'Present', 'Absent'}:
+        return chart_renderer.render(sorted_data, title)
+    colors = colormap_palette(len(sorted_data))
+    return render_pie_figure(sorted_data, title, colors)
 
-    if 'Present' in labels and 'Absent' in labels:
-        color_map = {'Present': '#2ECC71', 'Absent': '#E74C3C'}
-        colors = [color_map[label] for label in labels]
-    else:
-        colors = sns.color_palette("viridis", len(labels)).as_hex()
-
-    explode = tuple([0.03] * len(labels))
-    fig, ax = plt.subplots(figsize=(10, 10), subplot_kw=dict(aspect="equal"))
-
-    def autopct_format_absolute(values):
-        def my_format(pct):
-            total = sum(values)
-            val = int(round(pct * total / 100.0))
-            return f'{val}'
-        return my_format
-
-    wedges, texts, autotexts = ax.pie(
-        sizes, labels=labels, colors=colors,
-        autopct=autopct_format_absolute(sizes),
-        startangle=90, pctdistance=0.8, explode=explode, shadow=True,
-        wedgeprops=dict(width=0.4, edgecolor='w', linewidth=2),
-        textprops={'fontsize': 16, 'weight': 'bold'}
-    )
-
-    plt.setp(autotexts, size=20, weight="bold", color='white')
-    for autotext in autotexts:
-        autotext.set_path_effects([path_effects.withStroke(linewidth=3, foreground='black')])
-
-    plt.setp(texts, size=18, weight="bold", color='#363636')
-    ax.set_title(title, fontsize=24, pad=25, weight='bold', color='#333333')
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, transparent=True)
-    buf.seek(0)
-    plt.close(fig)
-    return buf
-
-
-# --- ROLE-BASED FLOW HANDLERS ---
-def handle_executive_flow(phone, user_details, message_data):
-    if message_data.get("type") == "interactive":
-        interactive_data = message_data.get("interactive", {})
-        selected_id = (interactive_data.get("button_reply") or interactive_data.get("list_reply", {})).get("id", "")
-        if selected_id == 'exec_view_report':
-            all_supervisors = get_all_supervisors()
-            if not all_supervisors:
-                send_text_message(phone, "No data available to generate a report.")
-                return
-            _, company_stats = get_ba_attendance_summary_for_supervisors([s['name'] for s in all_supervisors])
-            company_chart_data = {'Present': company_stats.get('present', 0), 'Absent': company_stats.get('absent', 0)}
-            image_buffer = create_attendance_pie_chart(company_chart_data, "NFL Attendance Report")
-            team_leads = get_all_team_leads()
-            text_breakdown = "🏢 *Company-Wide Attendance Summary*\n"
-            for lead in team_leads:
-                lead_supervisors = get_subordinates_by_role(lead['user_id'], 'Supervisor')
-                if lead_supervisors:
-                    _, lead_stats = get_ba_attendance_summary_for_supervisors([s['name'] for s in lead_supervisors])
-                    present_count = lead_stats.get('present', 0)
-                    absent_count = lead_stats.get('absent', 0)
-                    text_breakdown += f"\n👨‍💼 *{lead['name']} ({lead['role']})*\n✅ Present: {present_count} | ❌ Absent: {absent_count}"
-            send_chart_and_text_report(phone, image_buffer, text_breakdown)
-            if team_leads:
-                rows = [{"id": f"view_team-{lead['user_id']}", "title": lead['name'][:24]} for lead in team_leads]
-                send_interactive_list_message(phone, "Drill Down", "Select a team lead to view their report.",
-                                              "View Teams", [{"title": "Team Leads", "rows": rows}])
-            return
-        elif selected_id.startswith("view_team-"):
-            pm_id = int(selected_id.split('-')[1])
-            pm_details = get_user_details_by_id(pm_id)
-            if pm_details: handle_pm_flow(phone, pm_details, {"type": "text"})
-            return
-        elif selected_id.startswith("view_sup-"):
-            supervisor_id = int(selected_id.split('-')[1])
-            supervisor_details = get_user_details_by_id(supervisor_id)
-            if supervisor_details: handle_supervisor_flow(phone, supervisor_details, {"type": "text"})
-            return
-        elif selected_id.startswith("view_present-") or selected_id.startswith("view_absent-"):
-            handle_view_ba_list(phone, selected_id)
-            return
-    rows = [{"id": "exec_view_report", "title": "View Attendance Report"}]
-    send_interactive_list_message(phone, f"Welcome, {user_details['name']}", "Please select an option to get started.",
-                                  "Main Menu", [{"title": "Options", "rows": rows}])
-
-
-def handle_pm_flow(phone, user_details, message_data):
-    if message_data.get("type") == "interactive":
-        selected_id = (message_data.get("interactive", {}).get("list_reply") or message_data.get("interactive", {}).get(
-            "button_reply", {})).get("id", "")
-        if selected_id.startswith("view_sup-"):
-            supervisor_id = int(selected_id.split('-')[1])
-            supervisor_details = get_user_details_by_id(supervisor_id)
-            if supervisor_details: handle_supervisor_flow(phone, supervisor_details, {"type": "text"})
-            return
-        elif selected_id.startswith("view_present-") or selected_id.startswith("view_absent-"):
-            handle_view_ba_list(phone, selected_id)
-            return
-    pm_id = user_details['user_id']
-    pm_name = user_details['name']
-    supervisors = get_subordinates_by_role(pm_id, 'Supervisor')
-    if not supervisors:
-        send_text_message(phone, "You have no supervisors assigned to you.")
-        return
-    summary_text, team_stats = get_ba_attendance_summary_for_supervisors([s['name'] for s in supervisors])
-    chart_data = {'Present': team_stats.get('present', 0), 'Absent': team_stats.get('absent', 0)}
-    image_buffer = create_attendance_pie_chart(chart_data, f"Team Attendance for {pm_name}")
-    text_breakdown = f"👨‍💼 *Team Report for {pm_name}*\n\n"
-    text_breakdown += f"{summary_text}\n\n*Breakdown by Supervisor:*"
-    for sup in supervisors:
-        _, sup_stats = get_ba_attendance_summary_for_supervisors([sup['name']])
-        present_count = sup_stats.get('present', 0)
-        absent_count = sup_stats.get('absent', 0)
-        text_breakdown += f"\n\n👤 *{sup['name']}*\n✅ Present: {present_count} | ❌ Absent: {absent_count}"
-    send_chart_and_text_report(phone, image_buffer, text_breakdown)
-    rows = [{"id": f"view_sup-{s['user_id']}", "title": s['name'][:24]} for s in supervisors]
-    send_interactive_list_message(phone, "Drill Down", "Select a supervisor to view their report.", "View Supervisors",
-                                  [{"title": "Supervisors", "rows": rows}])
-
-
-def handle_supervisor_flow(phone, user_details, message_data):
-    if message_data.get("type") == "interactive":
-        selected_id = (message_data.get("interactive", {}).get("button_reply") or {}).get("id", "")
-        if selected_id.startswith("view_present-") or selected_id.startswith("view_absent-"):
-            handle_view_ba_list(phone, selected_id)
+
+@stage_seconds.timed('chart')
+def create_attendance_trend_chart(points, title):
+    if not any(rate is not None for _, rate in points):
+        return None
+    cache_key = ChartCache.key(dict(points), title, 'trend-line')
+    return chart_cache.render(cache_key, lambda: render_trend_figure(points, title))
+
+
+# --- FLOW DRIVER ---
+def run_flow(phone, flow):
+    # Performs each operation a flows.py generator yields, on this worker thread, and sends the result back in.
+    result = None
+    while True:
+        try:
+            name, *args = flow.send(result)
+        except StopIteration:
             return
-    supervisor_id = user_details['user_id']
-    supervisor_name = user_details['name']
-    summary_text, stats = get_ba_attendance_summary_for_supervisors([supervisor_name])
-    chart_data = {'Present': stats.get('present', 0), 'Absent': stats.get('absent', 0)}
-    image_buffer = create_attendance_pie_chart(chart_data, f"Attendance for {supervisor_name}")
-    send_chart_and_text_report(phone, image_buffer, f"📋 *Report for {supervisor_name}*\n\n" + summary_text)
-    buttons = []
-    if stats.get('present', 0) > 0:
-        buttons.append({"id": f"view_present-{supervisor_id}", "title": "View Present BAs"})
-    if stats.get('absent', 0) > 0:
-        buttons.append({"id": f"view_absent-{supervisor_id}", "title": "View Absent BAs"})
-    if buttons:
-        send_interactive_button_message(phone, "Select an option to view names.", buttons)
-
-
-def handle_view_ba_list(phone, selected_id):
-    try:
-        action, supervisor_id_str = selected_id.split('-', 1)
-        supervisor_id = int(supervisor_id_str)
-    except (ValueError, IndexError):
-        send_text_message(phone, "❌ Invalid selection.")
-        return
-    supervisor_details = get_user_details_by_id(supervisor_id)
-    if not supervisor_details:
-        send_text_message(phone, "❌ Supervisor details not found.")
-        return
-    _, stats = get_ba_attendance_summary_for_supervisors([supervisor_details['name']])
-    list_type = "Present" if action == "view_present" else "Absent"
-    status_emoji = "✅" if list_type == "Present" else "❌"
-    names_key = 'present_names' if list_type == "Present" else 'absent_names'
-    ba_list = stats.get(names_key, [])
-    if ba_list:
-        sorted_ba_list = sorted(ba_list)
-        message_parts = [f"{status_emoji} *{list_type} BAs for {supervisor_details['name']}:*"]
-        for name, store in sorted_ba_list:
-            message_parts.append(f"\n👤 *{name}*\n🏬 _{store}_")
-        message = "\n".join(message_parts)
-    else:
-        message = f"No {list_type.lower()} BAs found for {supervisor_details['name']}."
-    send_text_message(phone, message)
+        result = FLOW_QUERIES[name](*args) if name in FLOW_QUERIES else FLOW_REPLIES[name](phone, *args)
+
+
+def send_chart_report(phone, chart_data, title, caption_text):
+    return send_chart_and_text_report(phone, create_attendance_pie_chart(chart_data, title), caption_text)
+
+
+def send_trend_report(phone, points, title, caption_text):
+    return send_chart_and_text_report(phone, create_attendance_trend_chart(points, title), caption_text)
+
+
+# --- CONVERSATION STATE ---
+def remember_selection(phone, option_id, value):
+    conversation_cache.set((phone, option_id), value)
+
+
+def recall_selection(phone, option_id):
+    # None on a miss (expired, evicted, or sent by another worker process); flows then re-query.
+    return conversation_cache.get((phone, option_id))
 
 
 # --- DATABASE HELPERS ---
+# Hierarchy lookups are served from the in-memory snapshot; SQL is only used if it could not be loaded.
 def get_user_details(phone_number):
-    conn = None
+    if hierarchy_index.snapshot() is not None:
+        return user_fields(hierarchy_index.get_by_phone(phone_number))
     try:
-        conn = pymysql.connect(**DB_HIERARCHY_CONFIG)
-        with conn.cursor() as cursor:
+        with hierarchy_pool.connection() as conn, conn.cursor() as cursor:
             query = "SELECT user_id, name, role FROM user WHERE RIGHT(REPLACE(phone, '-', ''), 10) = RIGHT(%s, 10)"
             cursor.execute(query, (phone_number,))
             return cursor.fetchone()
     except pymysql.MySQLError as e:
         print(f"DB Error in get_user_details: {e}")
         return None
-    finally:
-        if conn: conn.close()
 
 
 def get_user_details_by_id(user_id):
-    conn = None
-    try:
-        conn = pymysql.connect(**DB_HIERARCHY_CONFIG)
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT user_id, name, role, phone FROM user WHERE user_id = %s", (user_id,))
-            return cursor.fetchone()
-    finally:
-        if conn: conn.close()
+    if hierarchy_index.snapshot() is not None:
+        return user_fields(hierarchy_index.get_by_id(user_id), ('user_id', 'name', 'role', 'phone'))
+    with hierarchy_pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT user_id, name, role, phone FROM user WHERE user_id = %s", (user_id,))
+        return cursor.fetchone()
 
 
 def get_subordinates_by_role(manager_id, role):
-    conn = None
-    try:
-        conn = pymysql.connect(**DB_HIERARCHY_CONFIG)
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT user_id, name, role FROM user WHERE manager_id = %s AND role = %s",
-                           (manager_id, role))
-            return cursor.fetchall() or []
-    finally:
-        if conn: conn.close()
+    if hierarchy_index.snapshot() is not None:
+        return [user_fields(u) for u in hierarchy_index.get_subordinates(manager_id, role)]
+    with hierarchy_pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT user_id, name, role FROM user WHERE manager_id = %s AND role = %s",
+                       (manager_id, role))
+        return cursor.fetchall() or []
 
 
-def get_all_team_leads():
-    conn = None
-    try:
-        conn = pymysql.connect(**DB_HIERARCHY_CONFIG)
-        with conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT DISTINCT m.user_id, m.name, m.role FROM user m JOIN user s ON m.user_id = s.manager_id WHERE s.role = 'Supervisor'")
-            return cursor.fetchall() or []
-    finally:
-        if conn: conn.close()
+def has_direct_reports(user_id):
+    snapshot = hierarchy_index.snapshot()
+    return bool(snapshot and snapshot.direct_reports(user_id))
 
 
-def get_all_supervisors():
-    conn = None
-    try:
-        conn = pymysql.connect(**DB_HIERARCHY_CONFIG)
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT user_id, name, role FROM user WHERE role = 'Supervisor'")
-            return cursor.fetchall() or []
-    finally:
-        if conn: conn.close()
+def get_supervisor_team_leads():
+    snapshot = hierarchy_index.snapshot()
+    if snapshot is None:
+        return fetch_supervisor_team_leads()
+    return snapshot.supervisor_team_leads()
 
 
-def get_ba_attendance_summary_for_supervisors(supervisor_names):
+@stage_seconds.timed('attendance')
+def get_ba_attendance_by_supervisor(supervisor_names):
     if not supervisor_names:
-        return "No supervisors found.", {}
-    conn = None
+        return "No supervisors found.", {}, {}
+    report = current_daily_report()
+    if report is not None and report.covers(supervisor_names):
+        return report.summarize(supervisor_names)
+    cache_key = ('summary', date.today().isoformat(), tuple(supervisor_names))
     try:
-        conn = pymysql.connect(**DB_ATTENDANCE_CONFIG)
-        with conn.cursor() as cursor:
-            placeholders = ', '.join(['%s'] * len(supervisor_names))
-            query = f"SELECT Supervisor, `BA Name`, `Store Name`, `BA Status` FROM V_NFL_BA_ATTENDANCE WHERE Supervisor IN ({placeholders}) AND `Date` = CURDATE()"
-            cursor.execute(query, supervisor_names)
-            todays_bas = cursor.fetchall() or []
-        if not todays_bas:
-            return "No BAs found assigned to the specified team(s) today.", {'present': 0, 'absent': 0,
-                                                                             'present_names': [], 'absent_names': []}
-        stats = {name: {'present': 0, 'absent': 0, 'present_names': [], 'absent_names': []} for name in
-                 supervisor_names}
-        for ba in todays_bas:
-            supervisor = ba.get('Supervisor')
-            if supervisor in stats:
-                ba_name, store_name = ba.get('BA Name', 'Unknown'), ba.get('Store Name', 'N/A')
-                if ba.get('BA Status') == 'Active':
-                    stats[supervisor]['present'] += 1
-                    stats[supervisor]['present_names'].append((ba_name, store_name))
-                else:
-                    stats[supervisor]['absent'] += 1
-                    stats[supervisor]['absent_names'].append((ba_name, store_name))
-        total_present = sum(s['present'] for s in stats.values())
-        total_absent = sum(s['absent'] for s in stats.values())
-        total_ba = total_present + total_absent
-        percentage = (total_present / total_ba * 100) if total_ba > 0 else 0
-        summary = f"✅ Present: *{total_present}*\n❌ Absent: *{total_absent}*\n👥 Total BAs: *{total_ba}*\n📊 Attendance Rate: *{percentage:.0f}%*"
-        final_stats = {
-            'present': total_present, 'absent': total_absent,
-            'present_names': [n for s in stats.values() for n in s['present_names']],
-            'absent_names': [n for s in stats.values() for n in s['absent_names']]
-        }
-        return summary.strip(), final_stats
+        return attendance_cache.get_or_load(cache_key, lambda: _load_attendance_by_supervisor(supervisor_names))
     except pymysql.MySQLError as err:
         print(f"Attendance DB Error: {err}")
-        return "Error fetching attendance data.", {}
-    finally:
-        if conn: conn.close()
+        return "Error fetching attendance data.", {}, {}
+
+
+def current_daily_report():
+    return report_materializer.current() if report_materializer else None
+
+
+def _load_attendance_by_supervisor(supervisor_names):
+    todays_bas = fetch_todays_attendance_rows(supervisor_names)
+    summary, stats, supervisor_stats = summarize_attendance(supervisor_names, todays_bas)
+    if not todays_bas:
+        summary = NO_BAS_TODAY
+    return summary, stats, supervisor_stats
+
+
+@stage_seconds.timed('attendance')
+def get_company_attendance_rollup():
+    report = current_daily_report()
+    if report is not None:
+        return report.company
+    try:
+        supervisors = get_supervisor_team_leads()
+        if not supervisors:
+            return None
+        names = sorted({s['name'] for s in supervisors})
+        cache_key = ('counts', date.today().isoformat(), tuple(names))
+        counts = attendance_cache.get_or_load(cache_key, lambda: fetch_todays_status_counts(names))
+        snapshot = hierarchy_index.snapshot()
+        return build_org_rollup(snapshot, counts) if snapshot else build_company_rollup(supervisors, counts)
+    except pymysql.MySQLError as err:
+        print(f"Attendance DB Error: {err}")
+        return None
+
+
+def get_org_node(user_id):
+    # Any manager's level of the org from the rollup's precomputed totals; None without a hierarchy snapshot.
+    report = current_daily_report()
+    if report is not None:
+        return report.org_node(user_id)
+    snapshot = hierarchy_index.snapshot()
+    if snapshot is None:
+        return None
+    rollup = get_company_attendance_rollup()
+    if not rollup or 'totals' not in rollup:
+        return None
+    return org_node(snapshot, rollup['totals'], user_id)
+
+
+@stage_seconds.timed('trends')
+def get_attendance_trend(supervisor_names, groups=None):
+    today = date.today()
+    sync_trend_store(today)
+    return build_trend(trend_store, supervisor_names, today, groups)
+
+
+def sync_trend_store(today):
+    # Copies the completed days missing from the rollup; if MySQL is down, or another worker holds the
+    # SQLite write lock past its timeout, the days already stored are served and the next request retries.
+    with trend_sync_lock:
+        try:
+            missing = trend_store.missing_range(today)
+            if missing is not None:
+                trend_store.store(*missing, fetch_daily_status_counts(*missing))
+        except pymysql.MySQLError as err:
+            print(f"Trend sync DB Error: {err}")
+        except sqlite3.Error as err:
+            print(f"Trend store error: {err}")
 
 
 # --- WHATSAPP MESSAGE SENDERS ---
 def send_chart_and_text_report(phone, image_buffer, caption_text):
+    # caption_text: a string or report pieces. The first caption-sized chunk goes with the image and the
+    # rest follows as text messages, in order. True once the whole report reached the phone.
     if image_buffer:
         media_id = upload_whatsapp_media(image_buffer)
         if media_id:
-            send_whatsapp_image_message(phone, media_id, caption_text)
-        else:
-            send_text_message(phone,
-                              "⚠️ Could not generate the chart image. Here is the text summary:\n\n" + caption_text)
-    else:
-        send_text_message(phone, "⚠️ No data to generate a chart. Here is the text summary:\n\n" + caption_text)
+            chunks = pack_messages(caption_text, first_limit=CAPTION_LIMIT)
+            return send_whatsapp_image_message(phone, media_id, next(chunks, "")) and _send_text_chunks(phone, chunks)
+        return send_text_message(phone, itertools.chain([CHART_FAILED], _pieces(caption_text)))
+    return send_text_message(phone, itertools.chain([NO_CHART_DATA], _pieces(caption_text)))
+
+
+def _pieces(text):
+    return [text] if isinstance(text, str) else text
 
 
 def send_interactive_list_message(phone, header_text, body_text, button_text, sections):
-    payload = {"messaging_product": "whatsapp", "to": phone, "type": "interactive",
-               "interactive": {"type": "list", "header": {"type": "text", "text": header_text},
-                               "body": {"text": body_text}, "action": {"button": button_text, "sections": sections}}}
-    send_whatsapp_message(payload)
+    # One page of a menu; flows.menu splits long ones.
+    return send_whatsapp_message(list_payload(phone, header_text, body_text, button_text, sections))
 
 
 def send_interactive_button_message(phone, body, buttons):
     if not buttons: return
-    payload = {"messaging_product": "whatsapp", "to": phone, "type": "interactive",
-               "interactive": {"type": "button", "body": {"text": body},
-                               "action": {"buttons": [{"type": "reply", "reply": b} for b in buttons[:3]]}}}
-    send_whatsapp_message(payload)
+    return send_whatsapp_message(button_payload(phone, body, buttons))
 
 
 def send_text_message(phone, message):
-    payload = {"messaging_product": "whatsapp", "to": phone, "text": {"body": str(message)[:4096]}}
-    send_whatsapp_message(payload)
+    # message: a string or report pieces; long replies go out as several messages.
+    return _send_text_chunks(phone, pack_messages(message))
+
+
+def _send_text_chunks(phone, chunks):
+    # In order, on the calling thread; a failed send stops the rest so the reader never sees a gap.
+    for chunk in chunks:
+        if not send_whatsapp_message(text_payload(phone, chunk)):
+            return False
+    return True
 
 
 def upload_whatsapp_media(image_buffer):
-    url = f"https://graph.facebook.com/v19.0/{PHONE_NUMBER_ID}/media"
-    headers = {"Authorization": f"Bearer {ACCESS_TOKEN}"}
-    files = {'file': ('attendance.png', image_buffer, 'image/png'), 'messaging_product': (None, 'whatsapp')}
+    # Charts from create_attendance_pie_chart carry a cache key, so identical charts are uploaded once.
+    cache_key = getattr(image_buffer, 'cache_key', None)
+    if cache_key:
+        return chart_cache.media_id(cache_key, lambda: _upload_whatsapp_media(image_buffer))
+    return _upload_whatsapp_media(image_buffer)
+
+
+@stage_seconds.timed('media_upload')
+def _upload_whatsapp_media(image_buffer):
     try:
-        response = requests.post(url, headers=headers, files=files, timeout=30)
-        response.raise_for_status()
-        media_id = response.json().get('id')
+        media_id = graph_client.upload_media(image_buffer.getvalue(), 'attendance.png', 'image/png')
         print(f"Media uploaded successfully. ID: {media_id}")
         return media_id
     except requests.exceptions.RequestException as e:
+        outbound_errors_total.inc('media')
         print(f"Error uploading media: {e}")
-        if e.response: print(f"Response body: {e.response.text}")
+        if e.response is not None: print(f"Response body: {e.response.text}")
         return None
 
 
 def send_whatsapp_image_message(phone, media_id, caption=""):
-    payload = {"messaging_product": "whatsapp", "to": phone, "type": "image",
-               "image": {"id": media_id, "caption": caption}}
-    send_whatsapp_message(payload)
+    return send_whatsapp_message(image_payload(phone, media_id, caption))
 
 
+@stage_seconds.timed('message_send')
 def send_whatsapp_message(payload):
-    url = f"https://graph.facebook.com/v19.0/{PHONE_NUMBER_ID}/messages"
-    headers = {"Authorization": f"Bearer {ACCESS_TOKEN}", "Content-Type": "application/json"}
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
+        graph_client.send_message(payload)
+        return True
     except requests.exceptions.HTTPError as e:
         print(f"Error sending message: {e}")
-        if e.response: print(f"Response body: {e.response.text}")
+        if e.response is not None: print(f"Response body: {e.response.text}")
     except requests.exceptions.RequestException as e:
         print(f"Error sending message: {e}")
+    outbound_errors_total.inc('messages')
+    return False
+
+
+FLOW_QUERIES = {
+    'user_by_id': get_user_details_by_id,
+    'subordinates': get_subordinates_by_role,
+    'supervisor_team_leads': get_supervisor_team_leads,
+    'company_rollup': get_company_attendance_rollup,
+    'org_node': get_org_node,
+    'attendance': get_ba_attendance_by_supervisor,
+    'trend': get_attendance_trend,
+}
+
+FLOW_REPLIES = {
+    'recall': recall_selection,
+    'remember': remember_selection,
+    'chart_report': send_chart_report,
+    'trend_report': send_trend_report,
+    'text': send_text_message,
+    'list': send_interactive_list_message,
+    'buttons': send_interactive_button_message,
+}
 
 
 # --- HEALTH CHECK ENDPOINT ---
 @app.route('/health', methods=['GET'])
 def health_check():
-    return {"status": "healthy", "timestamp": date.today().isoformat()}, 200
+    return {"status": "healthy", "timestamp": date.today().isoformat(), "workers": message_workers.stats(),
+            "graph_api": graph_client.stats(),
+            "report_snapshot": report_materializer.stats() if report_materializer else None,
+            "trend_store": trend_store.stats()}, 200
+
+
+# --- METRICS ENDPOINT ---
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def collect_component_stats():
+    # Point-in-time gauges from each component's own stats(), read only when /metrics is scraped.
+    yield from stats_samples("whatsapp_worker", message_workers.stats())
+    yield from stats_samples("whatsapp_db_pool", hierarchy_pool.stats(), pool="hierarchy")
+    yield from stats_samples("whatsapp_db_pool", attendance_pool.stats(), pool="attendance")
+    yield from stats_samples("whatsapp_cache", attendance_cache.stats(), cache="attendance")
+    yield from stats_samples("whatsapp_cache", conversation_cache.stats(), cache="conversation")
+    for name, cache_stats in chart_cache.stats().items():
+        yield from stats_samples("whatsapp_cache", cache_stats, cache=f"chart_{name}")
+    for endpoint, endpoint_stats in graph_client.stats().items():
+        yield from stats_samples("whatsapp_graph_api", endpoint_stats, endpoint=endpoint)
+    if report_materializer:
+        yield from stats_samples("whatsapp_report_snapshot", report_materializer.stats())
+    yield from stats_samples("whatsapp_trend_store", trend_store.stats())
+    hierarchy_age = hierarchy_index.age()
+    if hierarchy_age is not None:
+        yield "whatsapp_hierarchy_snapshot_age_seconds", {}, hierarchy_age
+
+
+registry.register_collector(collect_component_stats)
+
+
+# --- STARTUP WARM-UP ---
+def warm_up(preload=False):
+    # Does the first request's one-off work up front. preload=True is for a gunicorn master about to fork
+    # (see gunicorn.conf.py): only what is safe to share is primed, and no threads or sockets are left open.
+    # Nothing may escape from here: an exception out of a gunicorn hook kills the worker (or the master).
+    steps = [('charts', lambda: prime_chart_rendering(chart_renderer))]
+    if preload:
+        steps += [('hierarchy', hierarchy_index.preload),
+                  ('release', lambda: (hierarchy_pool.close_idle(), attendance_pool.close_idle()))]
+    else:
+        steps += [('db_pools', lambda: (hierarchy_pool.fill(), attendance_pool.fill())),
+                  ('hierarchy', hierarchy_index.snapshot), ('trends', lambda: sync_trend_store(date.today()))]
+        if report_materializer:
+            # current_daily_report() starts the materializer thread, which keeps the report just built.
+            steps += [('report', report_materializer.refresh), ('materializer', current_daily_report)]
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"[WARM-UP] {name} failed, it will load on first use instead: {e}")
+            traceback.print_exc()
+        timings[name] = time.perf_counter() - started
+    print(f"[WARM-UP] {'Preloaded' if preload else 'Warmed'} pid {os.getpid()} in {sum(timings.values()):.2f}s: "
+          + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
 
 
 # --- RUN THE APP ---
 if __name__ == "__main__":
+    if WARM_UP_ENABLED:
+        warm_up()
     port = int(os.environ.get("PORT", 3000))
     app.run(host="0.0.0.0", port=port)
 
@@ -0,0 +1,182 @@
+# metrics.py
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+# Seconds; spans a cached lookup (~ms) up to a Graph API call that exhausted its retries.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# --- METRIC TYPES ---
+# Label values are passed positionally in labelnames order; each metric takes one short lock per update.
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield self.name, dict(zip(self.labelnames, label_values)), value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    def timed(self, *label_values):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, *label_values)
+            return wrapper
+        return decorator
+
+    def samples(self):
+        with self._lock:
+            series = [(label_values, list(counts), total, count) for label_values, (counts, total, count) in
+                      self._series.items()]
+        for label_values, counts, total, count in series:
+            labels = dict(zip(self.labelnames, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class _Timer:
+    __slots__ = ("histogram", "label_values", "started")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+# --- REGISTRY ---
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def register_collector(self, collector):
+        # collector() -> iterable of (name, labels, value); rendered as gauges when /metrics is scraped.
+        self._collectors.append(collector)
+
+    def render(self):
+        # Prometheus text exposition format 0.0.4.
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(_format_sample(*sample) for sample in metric.samples())
+        gauges = {}
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                print(f"[METRICS] Collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for name, labels, value in samples:
+                gauges.setdefault(name, []).append((name, labels, value))
+        for name, samples in gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(_format_sample(*sample) for sample in samples)
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+def stats_samples(prefix, stats, **labels):
+    # Flattens a component's stats() dict into gauge samples, skipping non-numeric and nested values.
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        yield f"{prefix}_{key}", labels, value
+
+
+def _format_sample(name, labels, value):
+    if labels:
+        label_text = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+        return f"{name}{{{label_text}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# --- APPLICATION METRICS ---
+registry = MetricsRegistry()
+stage_seconds = registry.histogram(
+    "whatsapp_stage_seconds", "Time spent in each stage of answering a message.", ("stage",))
+flow_seconds = registry.histogram(
+    "whatsapp_flow_seconds", "Time to handle one message in a role flow, including all sends.", ("role",))
+db_query_seconds = registry.histogram(
+    "whatsapp_db_query_seconds", "Latency of database queries, including connection checkout.", ("query",))
+messages_total = registry.counter(
+    "whatsapp_messages_total", "Messages handled by a role flow, by outcome.", ("role", "outcome"))
+webhook_messages_total = registry.counter(
+    "whatsapp_webhook_messages_total", "Webhook messages received; result=duplicate counts dedup hits.",
+    ("result",))
+outbound_errors_total = registry.counter(
+    "whatsapp_outbound_errors_total", "Graph API calls that failed after retries.", ("endpoint",))
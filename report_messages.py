@@ -0,0 +1,191 @@
+# report_messages.py
+# Reply texts and Cloud API payloads, shared by the Flask app (main.py) and the ASGI app (asgi_app.py).
+import hashlib
+import json
+
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+BUTTON_LIMIT = 3
+ROW_TITLE_LIMIT = 24
+LIST_ROW_LIMIT = 10
+NEXT_PAGE_PREFIX = "list_page-"
+
+NOT_REGISTERED = "❌ Your phone number is not registered in the system."
+NO_ROLE = "❌ No role found for your account."
+NO_COMPANY_DATA = "No data available to generate a report."
+NO_SUPERVISORS = "You have no supervisors assigned to you."
+INVALID_SELECTION = "❌ Invalid selection."
+SUPERVISOR_NOT_FOUND = "❌ Supervisor details not found."
+CHART_FAILED = "⚠️ Could not generate the chart image. Here is the text summary:\n\n"
+NO_CHART_DATA = "⚠️ No data to generate a chart. Here is the text summary:\n\n"
+NO_TREND_DATA = "No attendance history is available yet."
+MENU_EXPIRED = "This menu has expired. Please send a message to start again."
+
+
+# --- REPORT TEXT ---
+# Multi-entry reports are generators of pieces (a header, then one piece per team, supervisor or BA, each
+# carrying its own leading line breaks); pack_messages() turns them into WhatsApp-sized messages.
+def no_flow_text(role):
+    return f"Your role ({role}) does not have a defined report flow."
+
+
+def company_summary_lines(team_leads):
+    yield "🏢 *Company-Wide Attendance Summary*\n"
+    for lead in team_leads:
+        yield f"\n👨‍💼 *{lead['name']} ({lead['role']})*\n✅ Present: {lead['present']} | ❌ Absent: {lead['absent']}"
+
+
+def team_report_lines(pm_name, summary_text, supervisors, supervisor_stats):
+    yield f"👨‍💼 *Team Report for {pm_name}*\n\n{summary_text}\n\n*Breakdown by Supervisor:*"
+    for sup in supervisors:
+        sup_stats = supervisor_stats.get(sup['name'], {})
+        present_count = sup_stats.get('present', 0)
+        absent_count = sup_stats.get('absent', 0)
+        yield f"\n\n👤 *{sup['name']}*\n✅ Present: {present_count} | ❌ Absent: {absent_count}"
+
+
+def org_report_lines(node, summary_text):
+    # A manager above team-lead level: their totals, then each direct report's.
+    yield f"🏢 *Report for {node['name']} ({node['role']})*\n\n{summary_text}\n\n*Breakdown:*"
+    for entry in node['managers'] + node['supervisors']:
+        yield (f"\n\n👨‍💼 *{entry['name']} ({entry['role']})*\n"
+               f"✅ Present: {entry['present']} | ❌ Absent: {entry['absent']}")
+
+
+def supervisor_report_text(supervisor_name, summary_text):
+    return f"📋 *Report for {supervisor_name}*\n\n" + summary_text
+
+
+def ba_list_lines(action, supervisor_name, ba_list):
+    list_type = "Present" if action == "view_present" else "Absent"
+    status_emoji = "✅" if list_type == "Present" else "❌"
+    if not ba_list:
+        yield f"No {list_type.lower()} BAs found for {supervisor_name}."
+        return
+    yield f"{status_emoji} *{list_type} BAs for {supervisor_name}:*"
+    for name, store in sorted(ba_list):
+        yield f"\n\n👤 *{name}*\n🏬 _{store}_"
+
+
+def _rate_text(rate):
+    return "n/a" if rate is None else f"{rate:.1f}%"
+
+
+def trend_report_lines(name, trend, breakdown_title=None):
+    # trend: from trends.build_trend(); changes are in percentage points against the previous window.
+    header = [f"📈 *Attendance Trends for {name}*\n"]
+    for window in trend['windows']:
+        header.append(f"\n📅 Last {window['days']} days: *{_rate_text(window['rate'])}*")
+        if window['rate'] is not None and window['previous_rate'] is not None:
+            change = window['rate'] - window['previous_rate']
+            header.append(f" ({'▲' if change >= 0 else '▼'} {abs(change):.1f} pts)")
+    yield "".join(header)
+    if trend['breakdown']:
+        yield f"\n\n*{breakdown_title} (7 / 30 days):*"
+        for label, (rate_7, rate_30) in trend['breakdown']:
+            yield f"\n👤 *{label}*: {_rate_text(rate_7)} | {_rate_text(rate_30)}"
+
+
+# --- CHUNKED DELIVERY ---
+def pack_messages(pieces, limit=TEXT_LIMIT, first_limit=None):
+    # Lazily packs a string or report pieces into messages of at most `limit` characters (`first_limit`
+    # for the first, e.g. an image caption), breaking between pieces so no entry is cut in half.
+    if isinstance(pieces, str):
+        pieces = [pieces]
+    current, current_limit = "", first_limit or limit
+    for piece in pieces:
+        if current and len(current) + len(piece) > current_limit:
+            yield current.rstrip()
+            current, current_limit = "", limit
+        if not current:
+            piece = piece.lstrip("\n")
+        while len(current) + len(piece) > current_limit:
+            # A single entry longer than a whole message: split it at a line break if there is one.
+            room = current_limit - len(current)
+            cut = piece.rfind("\n", 0, room)
+            cut = cut if cut > 0 else room
+            yield (current + piece[:cut]).rstrip()
+            current, current_limit, piece = "", limit, piece[cut:].lstrip("\n")
+        current += piece
+    if current.strip():
+        yield current.rstrip()
+
+
+def list_page(sections, page=0):
+    # -> (sections for one list message, id of its "next page" row or None). The Cloud API allows
+    # LIST_ROW_LIMIT rows per list, so longer menus show LIST_ROW_LIMIT - 1 rows plus a "next page" row.
+    rows = [(section['title'], row) for section in sections for row in section['rows']]
+    if len(rows) <= LIST_ROW_LIMIT:
+        return sections, None
+    per_page = LIST_ROW_LIMIT - 1
+    page_count = 1 + -(-(len(rows) - LIST_ROW_LIMIT) // per_page)
+    remaining = rows[page * per_page:]
+    page_rows = remaining if len(remaining) <= LIST_ROW_LIMIT else remaining[:per_page]
+    page_sections = []
+    for title, row in page_rows:
+        if not page_sections or page_sections[-1]['title'] != title:
+            page_sections.append({"title": title, "rows": []})
+        page_sections[-1]['rows'].append(row)
+    if page_rows is remaining:
+        return page_sections, None
+    # The id names the menu, so an old menu's "next page" row cannot page through a newer one.
+    token = hashlib.sha1(json.dumps([row['id'] for _, row in rows]).encode()).hexdigest()[:10]
+    next_id = f"{NEXT_PAGE_PREFIX}{token}-{page + 1}"
+    page_sections.append({"title": "More", "rows": [{"id": next_id, "title": "Next page ➡️",
+                                                     "description": f"Page {page + 2} of {page_count}"}]})
+    return page_sections, next_id
+
+
+# --- MENUS ---
+def executive_menu_rows():
+    return [{"id": "exec_view_report", "title": "View Attendance Report"},
+            {"id": "exec_view_trends", "title": "View Attendance Trends"}]
+
+
+def org_rows(nodes):
+    # Managers with managers below them open another org level; team leads open their team report.
+    return [{"id": f"{'view_team' if node.get('team_lead', True) else 'view_org'}-{node['user_id']}",
+             "title": node['name'][:ROW_TITLE_LIMIT]} for node in nodes]
+
+
+def supervisor_rows(supervisors):
+    return [{"id": f"view_sup-{s['user_id']}", "title": s['name'][:ROW_TITLE_LIMIT]} for s in supervisors]
+
+
+def ba_list_buttons(supervisor_id, stats):
+    buttons = []
+    if stats.get('present', 0) > 0:
+        buttons.append({"id": f"view_present-{supervisor_id}", "title": "View Present BAs"})
+    if stats.get('absent', 0) > 0:
+        buttons.append({"id": f"view_absent-{supervisor_id}", "title": "View Absent BAs"})
+    return buttons
+
+
+def team_trend_rows(pm_id):
+    return [{"id": f"trend_team-{pm_id}", "title": "Team Trends"}]
+
+
+def supervisor_trend_button(supervisor_id):
+    return {"id": f"trend_sup-{supervisor_id}", "title": "View Trends"}
+
+
+# --- CLOUD API PAYLOADS ---
+def text_payload(phone, message):
+    return {"messaging_product": "whatsapp", "to": phone, "text": {"body": str(message)[:TEXT_LIMIT]}}
+
+
+def image_payload(phone, media_id, caption=""):
+    return {"messaging_product": "whatsapp", "to": phone, "type": "image",
+            "image": {"id": media_id, "caption": caption[:CAPTION_LIMIT]}}
+
+
+def list_payload(phone, header_text, body_text, button_text, sections):
+    return {"messaging_product": "whatsapp", "to": phone, "type": "interactive",
+            "interactive": {"type": "list", "header": {"type": "text", "text": header_text},
+                            "body": {"text": body_text}, "action": {"button": button_text, "sections": sections}}}
+
+
+def button_payload(phone, body, buttons):
+    return {"messaging_product": "whatsapp", "to": phone, "type": "interactive",
+            "interactive": {"type": "button", "body": {"text": body},
+                            "action": {"buttons": [{"type": "reply", "reply": b} for b in buttons[:BUTTON_LIMIT]]}}}
@@ -0,0 +1,136 @@
+# report_snapshot.py
+import os
+import threading
+import time
+import traceback
+from datetime import date
+
+import pymysql
+
+from attendance import (build_company_rollup, build_org_rollup, describe_attendance, fetch_todays_attendance_rows,
+                        org_node, summarize_attendance)
+
+
+# --- DAILY REPORT TREE ---
+# Company -> team lead -> supervisor -> BA lists for one day, built in a single pass and never mutated.
+class DailyReport:
+    def __init__(self, supervisors, todays_bas, snapshot=None):
+        # snapshot: the hierarchy.HierarchySnapshot the supervisors came from, for any-depth rollups.
+        self.report_date = date.today()
+        self.built_at = time.monotonic()
+        names = list(dict.fromkeys(s['name'] for s in supervisors))
+        _, _, self.supervisor_stats = summarize_attendance(names, todays_bas)
+        counts = {name: {'present': s['present'], 'absent': s['absent']} for name, s in self.supervisor_stats.items()}
+        # None when there are no supervisors at all, matching get_company_attendance_rollup().
+        self.company = None
+        if supervisors:
+            self.company = build_org_rollup(snapshot, counts) if snapshot else build_company_rollup(supervisors, counts)
+        self._snapshot = snapshot
+        self.team_leads_by_id = {lead['user_id']: lead for lead in (self.company or {}).get('team_leads', [])}
+
+    def age(self):
+        return time.monotonic() - self.built_at
+
+    def org_node(self, user_id):
+        # Any manager's drill-down level from the precomputed totals; falls back to the two-level rollup.
+        if self._snapshot is not None and self.company:
+            return org_node(self._snapshot, self.company['totals'], user_id)
+        return self.team_leads_by_id.get(user_id)
+
+    def covers(self, supervisor_names):
+        return all(name in self.supervisor_stats for name in supervisor_names)
+
+    def summarize(self, supervisor_names):
+        # Same (summary, stats, per-supervisor stats) shape as the on-demand attendance query.
+        supervisor_stats = {name: self.supervisor_stats[name] for name in supervisor_names}
+        total_present = sum(s['present'] for s in supervisor_stats.values())
+        total_absent = sum(s['absent'] for s in supervisor_stats.values())
+        stats = {
+            'present': total_present, 'absent': total_absent,
+            'present_names': [n for s in supervisor_stats.values() for n in s['present_names']],
+            'absent_names': [n for s in supervisor_stats.values() for n in s['absent_names']]
+        }
+        return describe_attendance(total_present, total_absent), stats, supervisor_stats
+
+
+def build_daily_report(supervisors, snapshot=None):
+    # supervisors: rows shaped like attendance.fetch_supervisor_team_leads(); one attendance query for all.
+    names = list(dict.fromkeys(s['name'] for s in supervisors))
+    todays_bas = fetch_todays_attendance_rows(names) if names else []
+    return DailyReport(supervisors, todays_bas, snapshot)
+
+
+# --- MATERIALIZER ---
+class ReportMaterializer:
+    def __init__(self, supervisor_source, refresh_interval, max_age, snapshot_source=None):
+        # supervisor_source() -> rows shaped like attendance.fetch_supervisor_team_leads();
+        # snapshot_source() -> the current HierarchySnapshot or None.
+        self._supervisor_source = supervisor_source
+        self._snapshot_source = snapshot_source
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self._report = None
+        self._refresh_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stats = {"builds": 0, "build_errors": 0, "last_build_seconds": 0.0}
+
+    def current(self):
+        # The latest report if it is for today and fresh enough; otherwise None so callers query directly.
+        self._ensure_started()
+        report = self._report
+        if report is None or report.report_date != date.today() or report.age() > self.max_age:
+            return None
+        return report
+
+    def refresh(self):
+        with self._refresh_lock:
+            started = time.monotonic()
+            snapshot = self._snapshot_source() if self._snapshot_source else None
+            report = build_daily_report(self._supervisor_source(), snapshot)
+            self._report = report  # atomic reference swap; readers never see a half-built tree
+            self._stats["builds"] += 1
+            self._stats["last_build_seconds"] = time.monotonic() - started
+            return report
+
+    def age(self):
+        report = self._report
+        return None if report is None else report.age()
+
+    def stats(self):
+        return dict(self._stats, age_seconds=self.age())
+
+    def stop(self):
+        self._stop.set()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="report-materializer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # A report built just before the thread started (e.g. by main.warm_up) is not rebuilt straight away.
+        report = self._report
+        if report is not None and self._stop.wait(max(0.0, self.refresh_interval - report.age())):
+            return
+        while True:
+            try:
+                self.refresh()
+            except pymysql.MySQLError as e:
+                self._stats["build_errors"] += 1
+                print(f"[REPORTS] Materialization failed, keeping previous snapshot: {e}")
+            except Exception:
+                # Anything else is a bug, but the thread must live on: a dead one is never restarted.
+                self._stats["build_errors"] += 1
+                print("[REPORTS] Materialization failed, keeping previous snapshot:")
+                traceback.print_exc()
+            if self._stop.wait(self.refresh_interval):
+                return
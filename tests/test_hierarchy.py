@@ -0,0 +1,77 @@
+# tests/test_hierarchy.py
+# HierarchySnapshot closure (manager_id cycles) and the company rollup's breakdown.
+#   python -m pytest tests
+from attendance import UNASSIGNED_NAME, build_company_rollup, build_org_rollup
+from hierarchy import HierarchySnapshot
+
+
+def user(user_id, manager_id, role='PM'):
+    return {'user_id': user_id, 'name': f"User {user_id}", 'role': role, 'phone': None, 'manager_id': manager_id}
+
+
+def ids(users):
+    return [u['user_id'] for u in users]
+
+
+# --- CYCLES ---
+def test_two_user_cycle_is_broken_in_both_maps():
+    snapshot = HierarchySnapshot([user(11, 10), user(10, 11), user(12, 11, 'Supervisor')])
+    assert ids(snapshot.direct_reports(10)) == [11]
+    assert ids(snapshot.direct_reports(11)) == [12]
+    assert ids(snapshot.manager_reports(11)) == []
+    assert snapshot.ancestors(10) == ()
+    assert snapshot.ancestors(12) == (10, 11)
+    assert ids(snapshot.top_managers()) == [10]
+
+
+def test_cycle_is_broken_at_its_lowest_id_not_at_a_user_hanging_off_it():
+    snapshot = HierarchySnapshot([user(5, 21, 'Supervisor'), user(21, 20), user(20, 21)])
+    assert snapshot.ancestors(20) == ()
+    assert snapshot.ancestors(5) == (20, 21)
+    assert ids(snapshot.subtree(20)) == [21, 5]
+
+
+def test_every_user_is_walked_once_with_self_loops_and_longer_cycles():
+    users = [user(7, 7), user(30, 32), user(31, 30), user(32, 31), user(1, None, 'Executive'), user(2, 1)]
+    snapshot = HierarchySnapshot(users)
+    assert sorted(ids(snapshot._preorder)) == sorted(ids(users))
+    assert snapshot.ancestors(32) == (30, 31)
+    assert ids(snapshot.direct_reports(32)) == []
+
+
+# --- COMPANY BREAKDOWN ---
+def org_with_loose_supervisors():
+    # Executive 1 over zonal head 8 (PM 9 below), PM 2 and supervisor 5 directly; supervisor 6 has no
+    # manager and supervisor 7's manager is not in the table.
+    users = [user(1, None, 'Executive'), user(2, 1), user(3, 2, 'Supervisor'), user(4, 2, 'Supervisor'),
+             user(5, 1, 'Supervisor'), user(6, None, 'Supervisor'), user(7, 999, 'Supervisor'), user(8, 1),
+             user(9, 8), user(10, 9, 'Supervisor')]
+    snapshot = HierarchySnapshot(users)
+    counts = {u['name']: {'present': u['user_id'], 'absent': 1} for u in users if u['role'] == 'Supervisor'}
+    return snapshot, counts
+
+
+def assert_breakdown_adds_up(rollup):
+    assert sum(lead['present'] for lead in rollup['team_leads']) == rollup['present']
+    assert sum(lead['absent'] for lead in rollup['team_leads']) == rollup['absent']
+
+
+def test_org_rollup_gives_every_supervisor_one_entry():
+    snapshot, counts = org_with_loose_supervisors()
+    rollup = build_org_rollup(snapshot, counts)
+    assert [lead['name'] for lead in rollup['team_leads']] == ["User 2", "User 8", "User 1", UNASSIGNED_NAME]
+    assert_breakdown_adds_up(rollup)
+    executive, unassigned = rollup['team_leads'][2:]
+    assert executive['team_lead'] and ids(executive['supervisors']) == [5]
+    assert ids(unassigned['supervisors']) == [6, 7]
+    below_top = [s for top in snapshot.top_managers() for s in snapshot.supervisors_under(top['user_id'])]
+    grouped = [s for lead in rollup['team_leads'][2:] for s in lead['supervisors']]
+    assert sorted(ids(below_top + grouped)) == sorted(ids(snapshot.by_role['Supervisor']))
+
+
+def test_company_rollup_without_snapshot_adds_up():
+    snapshot, counts = org_with_loose_supervisors()
+    rollup = build_company_rollup(snapshot.supervisor_team_leads(), counts)
+    assert_breakdown_adds_up(rollup)
+    assert rollup['team_leads'][-1]['name'] == UNASSIGNED_NAME
+    assert ids(rollup['team_leads'][-1]['supervisors']) == [6, 7]
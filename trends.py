@@ -0,0 +1,176 @@
+# trends.py
+import datetime
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from attendance import PRESENT_STATUS
+
+TREND_WINDOWS = (7, 30)
+
+
+# --- DAILY ROLLUP STORE ---
+# Per-day, per-supervisor present/absent counts for completed days, kept in a local WAL-mode SQLite
+# file. A day is fetched from MySQL once; later syncs only ask for the days not yet in synced_days,
+# so trend reports never scan more than the new days of V_NFL_BA_ATTENDANCE.
+class TrendStore:
+    def __init__(self, path, history_days):
+        self.path = path
+        self.history_days = history_days
+        self._local = threading.local()
+        self._last_sync = None
+        self.error = None  # why the configured file is not in use (see create_trend_store)
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS daily_counts (day TEXT NOT NULL, supervisor TEXT NOT NULL, "
+                         "present INTEGER NOT NULL, absent INTEGER NOT NULL, PRIMARY KEY (day, supervisor))")
+            conn.execute("CREATE TABLE IF NOT EXISTS synced_days (day TEXT PRIMARY KEY)")
+        finally:
+            conn.close()
+
+    def missing_range(self, today):
+        # (start, end) of days still to fetch, end exclusive and never later than today; None when up to date.
+        first = today - datetime.timedelta(days=self.history_days)
+        synced = {row[0] for row in self._connection().execute(
+            "SELECT day FROM synced_days WHERE day >= ? AND day < ?", (first.isoformat(), today.isoformat()))}
+        for offset in range(self.history_days):
+            day = first + datetime.timedelta(days=offset)
+            if day.isoformat() not in synced:
+                return day, today
+        return None
+
+    def store(self, start, end, rows):
+        # rows from attendance.fetch_daily_status_counts(start, end); every day in the range is marked
+        # synced, including days without attendance rows (weekends, holidays).
+        counts = {}
+        for row in rows:
+            day_counts = counts.setdefault((str(row['day'])[:10], row['Supervisor']), [0, 0])
+            day_counts[0 if row['BA Status'] == PRESENT_STATUS else 1] += int(row['ba_count'])
+        days = [(start + datetime.timedelta(days=offset)).isoformat() for offset in range((end - start).days)]
+        oldest = (end - datetime.timedelta(days=self.history_days)).isoformat()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM daily_counts WHERE day >= ? AND day < ?", (start.isoformat(), end.isoformat()))
+            conn.executemany("INSERT INTO daily_counts (day, supervisor, present, absent) VALUES (?, ?, ?, ?)",
+                             [(day, supervisor, present, absent) for (day, supervisor), (present, absent) in
+                              counts.items()])
+            conn.executemany("INSERT OR IGNORE INTO synced_days (day) VALUES (?)", [(day,) for day in days])
+            conn.execute("DELETE FROM daily_counts WHERE day < ?", (oldest,))
+            conn.execute("DELETE FROM synced_days WHERE day < ?", (oldest,))
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        self._last_sync = time.time()
+        print(f"[TRENDS] Stored {len(counts)} supervisor-days for {len(days)} day(s) from {start}")
+
+    def daily_totals(self, supervisor_names, start, end):
+        # {day: {'present': n, 'absent': m}} summed over the supervisors, for days in [start, end).
+        query = ("SELECT day, SUM(present), SUM(absent) FROM daily_counts WHERE day >= ? AND day < ? "
+                 "AND supervisor IN ({}) GROUP BY day")
+        return {day: {'present': present, 'absent': absent}
+                for day, present, absent in self._select(query, supervisor_names, start, end)}
+
+    def supervisor_totals(self, supervisor_names, start, end):
+        # {supervisor: {'present': n, 'absent': m}} summed over the days in [start, end).
+        query = ("SELECT supervisor, SUM(present), SUM(absent) FROM daily_counts WHERE day >= ? AND day < ? "
+                 "AND supervisor IN ({}) GROUP BY supervisor")
+        return {supervisor: {'present': present, 'absent': absent}
+                for supervisor, present, absent in self._select(query, supervisor_names, start, end)}
+
+    def stats(self):
+        # A locked or corrupt file is reported as degraded instead of failing /health and /metrics.
+        stats = {"status": "degraded" if self.error else "ok",
+                 "last_sync_age": None if self._last_sync is None else time.time() - self._last_sync}
+        try:
+            conn = self._connection()
+            days, first, last = conn.execute("SELECT COUNT(*), MIN(day), MAX(day) FROM synced_days").fetchone()
+            rows = conn.execute("SELECT COUNT(*) FROM daily_counts").fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"[TRENDS] SQLite error while reading stats: {e}")
+            return dict(stats, status="degraded", error=str(e))
+        stats.update(days=days, rows=rows, first_day=first, last_day=last)
+        if self.error:
+            stats["error"] = self.error
+        return stats
+
+    # --- INTERNALS ---
+    def _select(self, query, supervisor_names, start, end):
+        names = list(supervisor_names)
+        if not names:
+            return []
+        query = query.format(', '.join(['?'] * len(names)))
+        return self._connection().execute(query, [start.isoformat(), end.isoformat()] + names).fetchall()
+
+    def _connection(self):
+        # One connection per thread (and per process), as in dedup.SQLiteDedupStore.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+
+def create_trend_store(path, history_days):
+    # As with dedup.create_dedup_store, a file that cannot be opened does not stop the app: the store falls
+    # back to a fresh per-process file, which the first sync refills from MySQL.
+    try:
+        return TrendStore(path, history_days)
+    except sqlite3.Error as e:
+        print(f"[TRENDS] Could not open {path} ({e}); falling back to a per-process store")
+        error = f"could not open {path}: {e}"
+    store = TrendStore(os.path.join(tempfile.gettempdir(), f"whatsapp-trends-{os.getpid()}.sqlite3"), history_days)
+    store.error = error
+    return store
+
+
+# --- TREND SUMMARIES ---
+def attendance_rate(counts):
+    total = counts['present'] + counts['absent'] if counts else 0
+    return counts['present'] / total * 100 if total else None
+
+
+def _sum_counts(counts_list):
+    return {'present': sum(c['present'] for c in counts_list), 'absent': sum(c['absent'] for c in counts_list)}
+
+
+def build_trend(store, supervisor_names, today, groups=None):
+    # groups: {label: [supervisor names]} for the breakdown, e.g. each supervisor of a team or each team
+    # of the company. Windows end yesterday; today's attendance is still coming in.
+    longest = max(TREND_WINDOWS)
+    windows = []
+    for days in TREND_WINDOWS:
+        start = today - datetime.timedelta(days=days)
+        previous = store.daily_totals(supervisor_names, start - datetime.timedelta(days=days), start)
+        current = store.daily_totals(supervisor_names, start, today)
+        windows.append({'days': days, 'rate': attendance_rate(_sum_counts(list(current.values()))),
+                        'previous_rate': attendance_rate(_sum_counts(list(previous.values())))})
+    daily = store.daily_totals(supervisor_names, today - datetime.timedelta(days=longest), today)
+    points = [(day, attendance_rate(daily[day])) for day in sorted(daily)]
+    breakdown = []
+    if groups:
+        per_window = {days: store.supervisor_totals(supervisor_names, today - datetime.timedelta(days=days), today)
+                      for days in TREND_WINDOWS}
+        for label, names in groups.items():
+            rates = [attendance_rate(_sum_counts([per_window[days][n] for n in names if n in per_window[days]]))
+                     for days in TREND_WINDOWS]
+            breakdown.append((label, rates))
+    return {'windows': windows, 'points': points, 'breakdown': breakdown}
+
+
+def team_lead_groups(supervisors):
+    # supervisors: rows shaped like attendance.fetch_supervisor_team_leads() -> {lead name: [supervisor names]}
+    groups = {}
+    for sup in supervisors:
+        if sup['lead_id'] is not None:
+            groups.setdefault(sup['lead_name'], []).append(sup['name'])
+    return groups
@@ -0,0 +1,39 @@
+# webhook_messages.py
+# Parsing of incoming Cloud API webhook payloads, shared by main.py and asgi_app.py.
+
+
+# --- WEBHOOK BATCHES ---
+def iter_webhook_messages(payload):
+    # Meta may batch several entries, changes and messages into one POST under load.
+    for entry in payload.get('entry') or []:
+        for change in entry.get('changes') or []:
+            for message in (change.get('value') or {}).get('messages') or []:
+                yield message
+
+
+def message_intent(message):
+    if message.get('type') == 'interactive':
+        interactive_data = message.get('interactive', {})
+        reply = interactive_data.get('list_reply') or interactive_data.get('button_reply') or {}
+        return f"interactive:{reply.get('id', '')}"
+    return message.get('type', 'unknown')
+
+
+def describe_message(message):
+    message_type = message.get('type', 'unknown')
+    if message_type == 'text':
+        return message.get('text', {}).get('body', '')[:50]
+    if message_type == 'interactive':
+        interactive_data = message.get('interactive', {})
+        if interactive_data.get('type') == 'list_reply':
+            return f"List: {interactive_data.get('list_reply', {}).get('title', '')}"
+        if interactive_data.get('type') == 'button_reply':
+            return f"Button: {interactive_data.get('button_reply', {}).get('title', '')}"
+        return f"Interactive: {interactive_data.get('type', '')}"
+    return message_type
+
+
+def selected_option_id(message):
+    # The id of the list row or reply button that was tapped, or "" for any other message.
+    interactive_data = message.get('interactive', {}) if message.get('type') == 'interactive' else {}
+    return (interactive_data.get('list_reply') or interactive_data.get('button_reply') or {}).get('id', '')
@@ -0,0 +1,243 @@
+# whatsapp_client.py
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+# --- TOKEN BUCKET ---
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Blocks until a token is available and returns the time spent waiting.
+        waited = 0.0
+        while True:
+            delay = self._take()
+            if delay is None:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self):
+        waited = 0.0
+        while True:
+            delay = self._take()
+            if delay is None:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def _take(self):
+        # Takes a token and returns None, or returns how long until one is available.
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return None
+            return (1 - self._tokens) / self.rate
+
+
+# --- GRAPH API CLIENT ---
+class _GraphApiBase:
+    # Retry policy, send throttling and per-endpoint stats shared by the sync and asyncio clients.
+    def __init__(self, phone_number_id, base_url, send_rate, send_burst, max_retries, backoff_base, backoff_max,
+                 timeout):
+        self.phone_number_id = phone_number_id
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self._send_bucket = TokenBucket(send_rate, send_burst)
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def stats(self):
+        with self._lock:
+            stats = {endpoint: dict(values) for endpoint, values in self._stats.items()}
+        for values in stats.values():
+            calls = values.get("calls", 0)
+            values["latency_avg"] = values.get("latency_total", 0.0) / calls if calls else 0.0
+        return stats
+
+    def _url(self, endpoint):
+        return f"{self.base_url}/{self.phone_number_id}/{endpoint}"
+
+    def _backoff(self, attempt, response):
+        # Returns the delay before the next attempt, or None when the call should not be retried.
+        if attempt >= self.max_retries:
+            return None
+        retry_after = _parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.backoff_max else None
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _record_call(self, endpoint, latency, outcome):
+        with self._lock:
+            values = self._stats.setdefault(endpoint, {})
+            values["calls"] = values.get("calls", 0) + 1
+            values["latency_total"] = values.get("latency_total", 0.0) + latency
+            values["latency_max"] = max(values.get("latency_max", 0.0), latency)
+            values[outcome] = values.get(outcome, 0) + 1
+
+    def _record(self, endpoint, key, amount):
+        if not amount:
+            return
+        with self._lock:
+            values = self._stats.setdefault(endpoint, {})
+            values[key] = values.get(key, 0) + amount
+
+
+class GraphApiClient(_GraphApiBase):
+    def __init__(self, access_token, phone_number_id, base_url, send_rate=80, send_burst=80, max_retries=3,
+                 backoff_base=0.5, backoff_max=30.0, timeout=30, pool_size=16):
+        super().__init__(phone_number_id, base_url, send_rate, send_burst, max_retries, backoff_base, backoff_max,
+                         timeout)
+        # Keep-alive TLS connections shared by every worker thread.
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._session.headers["Authorization"] = f"Bearer {access_token}"
+
+    def send_message(self, payload):
+        response = self.request("messages", json=payload, rate_limited=True)
+        return response.json()
+
+    def upload_media(self, content, filename='attendance.png', mime_type='image/png'):
+        files = {'file': (filename, content, mime_type), 'messaging_product': (None, 'whatsapp')}
+        response = self.request("media", retry_disconnects=True, files=files)
+        return response.json().get('id')
+
+    def request(self, endpoint, rate_limited=False, retry_disconnects=False, **kwargs):
+        # POSTs to {base_url}/{phone_number_id}/{endpoint}; retries 429/5xx and connection errors with
+        # exponential backoff (honouring Retry-After), then raises like requests would. A connection dropped
+        # after the request was sent is only retried with retry_disconnects (a duplicate upload is harmless,
+        # a duplicate message is not).
+        url = self._url(endpoint)
+        attempt = 0
+        while True:
+            if rate_limited:
+                self._record(endpoint, "throttle_wait_seconds", self._send_bucket.acquire())
+            started = time.monotonic()
+            try:
+                response = self._session.post(url, timeout=self.timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                # Every failure is counted; read timeouts are not retried since the send may have landed.
+                self._record_call(endpoint, time.monotonic() - started, "network_errors")
+                dropped = isinstance(e, requests.exceptions.ConnectionError)
+                retryable = dropped and (retry_disconnects or _connect_failed(e))
+                delay = self._backoff(attempt, None) if retryable else None
+                if delay is None:
+                    self._record(endpoint, "errors", 1)
+                    raise
+            else:
+                self._record_call(endpoint, time.monotonic() - started, f"status_{response.status_code // 100}xx")
+                if response.status_code == 429:
+                    self._record(endpoint, "throttled", 1)
+                delay = self._backoff(attempt, response) if response.status_code in RETRY_STATUSES else None
+                if delay is None:
+                    if not response.ok:
+                        self._record(endpoint, "errors", 1)
+                    response.raise_for_status()
+                    return response
+            self._record(endpoint, "retries", 1)
+            time.sleep(delay)
+            attempt += 1
+
+
+def _connect_failed(error):
+    # True when the request never reached the server: a connect timeout or a refused/unresolvable host.
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+# --- ASYNCIO GRAPH API CLIENT ---
+class AsyncGraphApiClient(_GraphApiBase):
+    # Same retries, throttling and stats as GraphApiClient over httpx (only needed for asgi_app.py).
+    # Methods raise httpx.HTTPStatusError / httpx.TransportError where the sync client raises requests errors.
+    def __init__(self, access_token, phone_number_id, base_url, send_rate=80, send_burst=80, max_retries=3,
+                 backoff_base=0.5, backoff_max=30.0, timeout=30, pool_size=100):
+        import httpx
+
+        super().__init__(phone_number_id, base_url, send_rate, send_burst, max_retries, backoff_base, backoff_max,
+                         timeout)
+        self._httpx = httpx
+        self._client = httpx.AsyncClient(headers={"Authorization": f"Bearer {access_token}"}, timeout=timeout,
+                                         limits=httpx.Limits(max_connections=pool_size,
+                                                             max_keepalive_connections=pool_size))
+
+    async def send_message(self, payload):
+        response = await self.request("messages", json=payload, rate_limited=True)
+        return response.json()
+
+    async def upload_media(self, content, filename='attendance.png', mime_type='image/png'):
+        response = await self.request("media", files={'file': (filename, content, mime_type)},
+                                      data={'messaging_product': 'whatsapp'})
+        return response.json().get('id')
+
+    async def request(self, endpoint, rate_limited=False, **kwargs):
+        url = self._url(endpoint)
+        attempt = 0
+        while True:
+            if rate_limited:
+                self._record(endpoint, "throttle_wait_seconds", await self._send_bucket.acquire_async())
+            started = time.monotonic()
+            try:
+                response = await self._client.post(url, **kwargs)
+            except self._httpx.RequestError as e:
+                # As in the sync client, read timeouts are not retried since the send may have landed.
+                self._record_call(endpoint, time.monotonic() - started, "network_errors")
+                retryable = isinstance(e, (self._httpx.ConnectError, self._httpx.ConnectTimeout,
+                                           self._httpx.PoolTimeout))
+                delay = self._backoff(attempt, None) if retryable else None
+                if delay is None:
+                    self._record(endpoint, "errors", 1)
+                    raise
+            else:
+                self._record_call(endpoint, time.monotonic() - started, f"status_{response.status_code // 100}xx")
+                if response.status_code == 429:
+                    self._record(endpoint, "throttled", 1)
+                delay = self._backoff(attempt, response) if response.status_code in RETRY_STATUSES else None
+                if delay is None:
+                    if not response.is_success:
+                        self._record(endpoint, "errors", 1)
+                    response.raise_for_status()
+                    return response
+            self._record(endpoint, "retries", 1)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def _parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
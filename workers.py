@@ -0,0 +1,139 @@
+# workers.py
+import os
+import threading
+import time
+import traceback
+from collections import deque
+
+POLICY_REJECT = 'reject'
+POLICY_BLOCK = 'block'
+
+
+# --- KEYED WORKER POOL ---
+# Fixed number of threads fed by one bounded queue. Tasks that share a key (a sender's phone)
+# run strictly one after another in submission order; different keys run in parallel.
+class KeyedWorkerPool:
+    def __init__(self, max_workers, max_queue, policy=POLICY_REJECT, block_timeout=2.0, name="worker"):
+        if policy not in (POLICY_REJECT, POLICY_BLOCK):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._lock = threading.Lock()
+        self._work_ready = threading.Condition(self._lock)
+        self._space_free = threading.Condition(self._lock)
+        self._pending = {}
+        self._ready = deque()
+        self._active = set()
+        self._depth = 0
+        self._threads = []
+        self._pid = None
+        self._shutdown = False
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "max_depth": 0,
+                       "wait_time_total": 0.0, "wait_time_max": 0.0}
+
+    def submit(self, key, fn, *args, **kwargs):
+        # Returns False when the task was refused because the queue is full or the pool is shutting down.
+        with self._lock:
+            if self._shutdown:
+                self._stats["rejected"] += 1
+                return False
+            self._ensure_started()
+            if self._depth >= self.max_queue and self.policy == POLICY_BLOCK:
+                deadline = time.monotonic() + self.block_timeout
+                while self._depth >= self.max_queue and not self._shutdown:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._space_free.wait(remaining)
+            if self._depth >= self.max_queue or self._shutdown:
+                self._stats["rejected"] += 1
+                return False
+            queue = self._pending.get(key)
+            if queue is None:
+                queue = self._pending[key] = deque()
+            if not queue and key not in self._active:
+                self._ready.append(key)
+            queue.append((time.monotonic(), fn, args, kwargs))
+            self._depth += 1
+            self._stats["submitted"] += 1
+            self._stats["max_depth"] = max(self._stats["max_depth"], self._depth)
+            self._work_ready.notify()
+        return True
+
+    def shutdown(self, wait=True, timeout=None):
+        # Stops accepting work; queued tasks still drain before the threads exit.
+        with self._lock:
+            self._shutdown = True
+            self._work_ready.notify_all()
+            self._space_free.notify_all()
+            threads = list(self._threads) if self._pid == os.getpid() else []
+        if not wait:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            if self._depth:
+                print(f"[{self.name.upper()}] Shutdown timed out with {self._depth} queued tasks")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, depth=self._depth, active=len(self._active), max_queue=self.max_queue,
+                         workers=self.max_workers)
+        started = stats["completed"] + stats["failed"] + stats["active"]
+        stats["wait_time_avg"] = stats["wait_time_total"] / started if started else 0.0
+        return stats
+
+    # --- INTERNALS ---
+    def _ensure_started(self):
+        # Threads are started lazily so a pre-fork import (gunicorn --preload) does not leak them.
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._threads = []
+        for index in range(self.max_workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_task(self):
+        with self._lock:
+            while not self._ready:
+                if self._shutdown and not self._depth:
+                    return None
+                self._work_ready.wait()
+            key = self._ready.popleft()
+            enqueued_at, fn, args, kwargs = self._pending[key].popleft()
+            self._active.add(key)
+            self._depth -= 1
+            wait_time = time.monotonic() - enqueued_at
+            self._stats["wait_time_total"] += wait_time
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait_time)
+            self._space_free.notify()
+            return key, fn, args, kwargs
+
+    def _run(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            key, fn, args, kwargs = task
+            failed = False
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                traceback.print_exc()
+            with self._lock:
+                self._active.discard(key)
+                self._stats["failed" if failed else "completed"] += 1
+                if self._pending[key]:
+                    self._ready.append(key)
+                    self._work_ready.notify()
+                else:
+                    del self._pending[key]
+                if self._shutdown and not self._depth:
+                    self._work_ready.notify_all()